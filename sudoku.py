@@ -10,25 +10,22 @@
 ##   u is a unit,   e.g. ['A1','B1','C1','D1','E1','F1','G1','H1','I1']
 ##   grid is a grid,e.g. 81 non-blank chars, e.g. starting with '.18...7...
 ##   values is a dict of possible values, e.g. {'A1':'12349', 'A2':'8', ...}
+import functools
 import time, random
 
+import sudoku_parallel as parallel
+from sudoku_topology import cross, digits, rows, cols
+import sudoku_topology as topology
 
-def cross(A, B):
-    "Cross product of elements in A and elements in B."
-    return [a + b for a in A for b in B]
-
-
-digits = '123456789'
-rows = 'ABCDEFGHI'
-cols = digits
-squares = cross(rows, cols)
-unitlist = ([cross(rows, c) for c in cols] +
-            [cross(r, cols) for r in rows] +
-            [cross(rs, cs) for rs in ('ABC', 'DEF', 'GHI') for cs in ('123', '456', '789')])
-units = dict((s, [u for u in unitlist if s in u])
-             for s in squares)
-peers = dict((s, set(sum(units[s], [])) - set([s]))
-             for s in squares)
+## The tables are precomputed once in sudoku_topology, with square names as keys
+squares = list(topology.squares)
+unitlist = topology.named_unitlist
+units = topology.named_units
+peers = topology.named_peers
+## place_slots[s][d]: the indexes in Values.places of the place counts of d in the units of s
+place_slots = dict((s, dict((d, tuple(9 * k + j for k in topology.unit_membership[i]))
+                            for j, d in enumerate(digits)))
+                   for i, s in enumerate(squares))
 
 
 ################ Unit Tests ################
@@ -39,12 +36,17 @@ def test():
     assert len(unitlist) == 27
     assert all(len(units[s]) == 3 for s in squares)
     assert all(len(peers[s]) == 20 for s in squares)
-    assert units['C2'] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
-                           ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
-                           ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
+    assert [list(u) for u in units['C2']] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
+                                              ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
+                                              ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
     assert peers['C2'] == set(['A2', 'B2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2',
                                'C1', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9',
                                'A1', 'A3', 'B1', 'B3'])
+    values = parse_grid(grid2)
+    assert values.places == count_places(values) and eliminate(dict(values), 'A1', values['A1']) is False
+    assert dict(assign(dict(values), 'A1', values['A1'][0])) == dict(assign(values.copy(), 'A1', values['A1'][0]))
+    assert count_solutions(grid1) == 1 and count_solutions(hard1) > 1 and count_solutions('11' + '.' * 79) == 0
+    assert count_solutions('.' * 81, limit=5) == 5
     print('All tests pass.')
 
 
@@ -54,7 +56,8 @@ def parse_grid(grid):
     """Convert grid to a dict of possible values, {square: digits}, or
     return False if a contradiction is detected."""
     ## To start, every square can be any digit; then assign values from the grid.
-    values = dict((s, digits) for s in squares)
+    values = Values((s, digits) for s in squares)
+    values.places = [9] * len(unitlist) * 9
     for s, d in grid_values(grid).items():
         if d in digits and not assign(values, s, d):
             return False  ## (Fail if we can't assign d to square s.)
@@ -73,38 +76,65 @@ def grid_values(grid):
 def assign(values, s, d):
     """Eliminate all the other values (except d) from values[s] and propagate.
     Return values, except return False if a contradiction is detected."""
-    other_values = values[s].replace(d, '')
-    if all(eliminate(values, s, d2) for d2 in other_values):
-        return values
-    else:
-        return False
+    return propagate(values, [(s, d2) for d2 in values[s] if d2 != d])
 
 
 def eliminate(values, s, d):
     """Eliminate d from values[s]; propagate when values or places <= 2.
     Return values, except return False if a contradiction is detected."""
-    if d not in values[s]:
-        return values  ## Already eliminated
-    values[s] = values[s].replace(d, '')
-    ## (1) If a square s is reduced to one value d2, then eliminate d2 from the peers.
-    if len(values[s]) == 0:
-        return False  ## Contradiction: removed last value
-    elif len(values[s]) == 1:
-        d2 = values[s]
-        if not all(eliminate(values, s2, d2) for s2 in peers[s]):
-            return False
-    ## (2) If a unit u is reduced to only one place for a value d, then put it there.
-    for u in units[s]:
-        dplaces = [s for s in u if d in values[s]]
-        if len(dplaces) == 0:
-            return False  ## Contradiction: no place for this value
-        elif len(dplaces) == 1:
-            # d can only be in one place in unit; assign it there
-            if not assign(values, dplaces[0], d):
-                return False
+    return propagate(values, [(s, d)])
+
+
+def propagate(values, worklist):
+    """Make the eliminations (s, d) of worklist, and the ones they imply, until fixpoint.
+    Return values, except return False if a contradiction is detected."""
+    places = getattr(values, 'places', None)  # None for a plain dict: the units are scanned instead
+    while worklist:
+        s, d = worklist.pop()
+        if d not in values[s]:
+            continue  ## Already eliminated
+        values[s] = values[s].replace(d, '')
+        ## (1) If a square s is reduced to one value d2, then eliminate d2 from the peers.
+        if len(values[s]) == 0:
+            return False  ## Contradiction: removed last value
+        elif len(values[s]) == 1:
+            d2 = values[s]
+            worklist.extend((s2, d2) for s2 in peers[s] if d2 in values[s2])
+        ## (2) If a unit u is reduced to only one place for a value d, then put it there.
+        if places is None:
+            for u in units[s]:
+                dplaces = [s2 for s2 in u if d in values[s2]]
+                if len(dplaces) == 0:
+                    return False  ## Contradiction: no place for this value
+                elif len(dplaces) == 1:
+                    worklist.extend((dplaces[0], d3) for d3 in values[dplaces[0]] if d3 != d)
+            continue
+        for slot in place_slots[s][d]:
+            places[slot] -= 1
+            if places[slot] == 0:
+                return False  ## Contradiction: no place for this value
+            elif places[slot] == 1:
+                # d can only be in one place in unit; assign it there
+                s2 = next(s2 for s2 in unitlist[slot // 9] if d in values[s2])
+                worklist.extend((s2, d3) for d3 in values[s2] if d3 != d)
     return values
 
 
+def count_places(values):
+    """Return the list of place counts of values (see Values)."""
+    return [sum(d in values[s] for s in u) for u in unitlist for d in digits]
+
+
+class Values(dict):
+    """A dict of possible values that also keeps its place counts up to date: places[9*k + j] is
+    the number of squares of unitlist[k] where digits[j] is still possible."""
+
+    def copy(self):
+        values = Values(self)
+        values.places = self.places[:]
+        return values
+
+
 ################ Display as 2-D grid ################
 
 def display(values):
@@ -119,7 +149,12 @@ def display(values):
 
 ################ Search ################
 
-def solve(grid): return search(parse_grid(grid))
+def solve(grid, cache=None):
+    """Solve grid. When cache is a sudoku_cache.SolutionCache, a puzzle equivalent (under the
+    Sudoku symmetries) to one already solved is answered from the cache."""
+    if cache is not None:
+        return cache.solve(grid, solve)
+    return search(parse_grid(grid))
 
 
 def search(values):
@@ -144,6 +179,53 @@ def search(values):
     # for d in values[s])
 
 
+################ Counting solutions ################
+
+def count_solutions(grid, limit=2):
+    """Return the number of solutions of grid, counting at most up to limit
+    (limit=2 tells if the solution is unique: 0 none, 1 unique, 2 several)."""
+    return count_values(parse_grid(grid), limit)
+
+
+def count_values(values, limit=2):
+    """count_solutions for a values dict (or False), which is consumed."""
+    if values is False:
+        return 0
+    count = 0
+    stack = [(values, None, '')]  # (values, square, digits of square left to try)
+    while stack and count < limit:
+        values, s, ds = stack.pop()
+        if len(ds) > 1:
+            ## Siblings left: keep values for them and try the first digit on a copy
+            stack.append((values, s, ds[1:]))
+            values = assign(values.copy(), s, ds[0])
+        elif ds:
+            values = assign(values, s, ds)  ## Last digit of s: no copy needed
+        if values is False:
+            continue
+        unfilled = [s for s in squares if len(values[s]) > 1]
+        if not unfilled:
+            count += 1
+            continue
+        ## Chose the unfilled square s with the fewest possibilities
+        s = min(unfilled, key=lambda s: len(values[s]))
+        stack.append((values, s, values[s]))
+    return count
+
+
+def count_all(grids, name='', limit=2, workers=1):
+    """Count the solutions of a sequence of grids (up to limit each). Report how many have none,
+    one or several, and return the list of counts.
+    When workers is not 1, the grids are counted in a pool of workers processes (None for one per CPU)."""
+    grids = list(grids)
+    counts, wall = parallel.run(functools.partial(count_solutions, limit=limit), grids, workers)
+    N = len(grids)
+    if N >= 1:
+        print("Checked %d %s puzzles: %d unique, %d with several solutions, %d with none (%.2f secs)." % (
+            N, name, counts.count(1), sum(c > 1 for c in counts), counts.count(0), wall))
+    return counts
+
+
 ################ Utilities ################
 
 def some(seq):
@@ -167,16 +249,35 @@ def shuffled(seq):
 
 ################ System test ################
 
-def solve_all(grids, name='', showif=0.0):
+def time_solve(grid, cache=None):
+    """Solve grid and return (CPU seconds, values). Module-level so that
+    solve_all can run it in worker processes."""
+    start = time.process_time()
+    values = solve(grid, cache)
+    return time.process_time() - start, values
+
+
+def solve_all(grids, name='', showif=0.0, workers=1, cache=None, store=None):
     """Attempt to solve a sequence of grids. Report results.
     When showif is a number of seconds, display puzzles that take longer.
-    When showif is None, don't display any puzzles."""
-
-    def time_solve(grid):
-        # start = time.clock()
-        start = time.process_time()
-        values = solve(grid)
-        t = time.process_time() - start
+    When showif is None, don't display any puzzles.
+    When workers is not 1, the grids are solved in a pool of workers processes
+    (None for one per CPU).
+    The solution cache, if any, is only used when workers is 1 (it lives in this process).
+    When store is a sudoku_store.SolutionStore, the grids found in it are not solved again (they
+    count 0 secs) and the new solutions are added to it in bulk."""
+    grids = list(grids)
+    worker = functools.partial(time_solve, cache=cache if workers == 1 else None)
+    if store is not None:
+        known = store.get_many(grids)
+        todo = [grid for grid in grids if grid not in known]
+        timed_todo, wall = parallel.run(worker, todo, workers)
+        store.put_many((grid, values, 'Brute Force', t, None) for grid, (t, values) in zip(todo, timed_todo))
+        timed_todo = dict(zip(todo, timed_todo))
+        timed = [(0.0, known[grid]) if grid in known else timed_todo[grid] for grid in grids]
+    else:
+        timed, wall = parallel.run(worker, grids, workers)
+    for grid, (t, values) in zip(grids, timed):
         ## Display puzzles that take long enough
         display(grid_values(grid))
         if values: display(values)
@@ -184,13 +285,18 @@ def solve_all(grids, name='', showif=0.0):
             display(grid_values(grid))
             if values: display(values)
             print('(%.2f seconds)\n' % t)
-        return (t, solved(values))
-
-    times, results = zip(*[time_solve(grid) for grid in grids])
+    times = [t for t, values in timed]
+    results = [solved(values) for t, values in timed]
     N = len(grids)
+    hz = N / sum(times) if sum(times) else 999  # (all 0.0 when every grid comes from the store)
     if N > 1:
         print("Solved %d of %d %s puzzles (avg %.2f secs (%d Hz), max %.2f secs)." % (
-            sum(results), N, name, sum(times) / N, N / sum(times), max(times)))
+            sum(results), N, name, sum(times) / N, hz, max(times)))
+        parallel.report(N, wall, sum(times), workers)
+        if cache is not None and workers == 1:
+            print("    cache %s" % cache.stats())
+        if store is not None:
+            print("    store %s" % store.stats())
 
 
 def solved(values):
@@ -198,21 +304,22 @@ def solved(values):
 
     def unitsolved(unit): return set(values[s] for s in unit) == set(digits)
 
-    return values is not False and all(unitsolved(unit) for unit in unitlist)
+    return bool(values) and all(unitsolved(unit) for unit in unitlist)
 
 
 def random_puzzle(N=17):
     """Make a random puzzle with N or more assignments. Restart on contradictions.
     Note the resulting puzzle is not guaranteed to be solvable, but empirically
-    about 99.8% of them are solvable. Some have multiple solutions."""
-    values = dict((s, digits) for s in squares)
-    for s in shuffled(squares):
-        if not assign(values, s, random.choice(values[s])):
-            break
-        ds = [values[s] for s in squares if len(values[s]) == 1]
-        if len(ds) >= N and len(set(ds)) >= 8:
-            return ''.join(values[s] if len(values[s]) == 1 else '.' for s in squares)
-    return random_puzzle(N)  ## Give up and make a new puzzle
+    about 99.8% of them are solvable. Some have multiple solutions.
+    (See sudoku_generate for puzzles with a unique solution.)"""
+    while True:
+        values = parse_grid('.' * 81)
+        for s in shuffled(squares):
+            if not assign(values, s, random.choice(values[s])):
+                break  ## Give up and make a new puzzle
+            ds = [values[s] for s in squares if len(values[s]) == 1]
+            if len(ds) >= N and len(set(ds)) >= 8:
+                return ''.join(values[s] if len(values[s]) == 1 else '.' for s in squares)
 
 
 grid1 = '003020600900305001001806400008102900700000008006708200002609500800203009005010300'
@@ -0,0 +1,154 @@
+## Vectorized constraint propagation over a batch of puzzles (NumPy)
+
+## parse_grid propagates one puzzle at a time in Python. Here a whole batch is an
+## (N, 81) uint16 array of candidate masks (same bits as sudoku_bits), and each
+## round of naked singles and hidden singles is a handful of array operations over
+## all the boards at once. The rounds go on until every board reaches a fixpoint:
+## solved, contradiction, or stuck. Only the stuck boards are handed one by one to
+## the scalar search of sudoku_bits, so easy puzzles never run a per-puzzle loop.
+
+## Throughout this module we have:
+##   cands is an (N, 81) uint16 array of masks (bit k set when digit k+1 is possible)
+##   status is an (N,) int8 array: solved, stuck or contradiction (see below)
+
+## Usage: python sudoku_batch.py [puzzle file [search method]]
+
+import functools
+import sys
+import time
+
+import numpy as np
+
+import sudoku
+import sudoku_bits
+import sudoku_parallel as parallel
+from sudoku_topology import peers, unitlist
+
+stuck, solved, contradiction = 0, 1, -1
+chunk_size = 4096  # Boards propagated together (the hidden singles use 2187 bytes per board)
+
+peer_index = np.array(peers)  # (81, 20)
+unit_index = np.array(unitlist)  # (27, 9): columns, rows, boxes; each group of 9 units covers the 81 squares
+digit_bits = (1 << np.arange(9)).astype(np.uint16)
+bitcount = np.array(sudoku_bits.bitcount, dtype=np.uint8)
+
+
+################ Parse the Grids ################
+
+def parse_grids(grids):
+    """Convert the grids to an (N, 81) array of masks: a given is a single bit, an empty square all bits.
+    No propagation is done."""
+    chars = ''.join(''.join(sudoku_bits.grid_chars(grid)) for grid in grids)
+    codes = np.frombuffer(chars.encode('ascii'), dtype=np.uint8).reshape(-1, 81).astype(np.int16) - ord('0')
+    given = (codes >= 1) & (codes <= 9)
+    return np.where(given, 1 << np.clip(codes - 1, 0, 8), sudoku_bits.allbits).astype(np.uint16)
+
+
+################ Constraint Propagation ################
+
+def propagate(cands):
+    """Apply naked and hidden singles to every board until fixpoint, in place.
+    Return the status of each board."""
+    status = np.empty(len(cands), dtype=np.int8)
+    for start in range(0, len(cands), chunk_size):
+        status[start:start + chunk_size] = propagate_chunk(cands[start:start + chunk_size])
+    return status
+
+
+def propagate_chunk(cands):
+    """propagate on a view of at most chunk_size boards."""
+    status = np.full(len(cands), stuck, dtype=np.int8)
+    active = np.arange(len(cands))  # boards not yet at fixpoint
+    while active.size:
+        c = cands[active]
+        counts = bitcount[c]
+        ## (1) Naked singles: remove the digit of every solved square from its peers
+        singles = np.where(counts == 1, c, 0).astype(np.uint16)
+        taken = np.bitwise_or.reduce(singles[:, peer_index], axis=2)
+        bad = ((singles & taken) != 0).any(axis=1)  ## Contradiction: the same digit twice in a unit
+        new = np.where(counts == 1, c, c & ~taken).astype(np.uint16)
+        ## (2) Hidden singles: a digit with only one place in a unit goes there
+        has = (new[:, unit_index, None] & digit_bits) != 0  # (n, 27 units, 9 squares, 9 digits)
+        places = has.sum(axis=2)
+        bad |= (places == 0).any(axis=(1, 2))  ## Contradiction: no place for a digit
+        only = (has & (places == 1)[:, :, None, :]) * digit_bits
+        hidden = only.sum(axis=3, dtype=np.uint16)  # distinct bits, so the sum is the union
+        forced = np.zeros_like(new)
+        for g in range(3):
+            forced[:, unit_index[9 * g:9 * g + 9].ravel()] |= hidden[:, 9 * g:9 * g + 9].reshape(-1, 81)
+        new = np.where(forced != 0, forced, new).astype(np.uint16)
+        bad |= (new == 0).any(axis=1) | (bitcount[forced] > 1).any(axis=1)  ## Two digits forced in one square
+        changed = (new != c).any(axis=1)
+        cands[active] = new
+        ## A board that did not change passed the checks above with its final masks
+        status[active[bad]] = contradiction
+        done = active[~bad & ~changed]
+        status[done] = np.where((bitcount[cands[done]] == 1).all(axis=1), solved, stuck)
+        active = active[~bad & changed]
+    return status
+
+
+################ Search ################
+
+def search_board(masks, search_method='Norvig Heuristic'):
+    """Finish a stuck board (a list of 81 masks) with the scalar search. Return a values dict or False."""
+    return sudoku_bits.to_values(sudoku_bits.search(masks, search_method))
+
+
+def solve_batch(grids, search_method='Norvig Heuristic', workers=1):
+    """Solve the grids and return their values dicts (False when unsolvable), in order, plus the status
+    of each board after the vectorized propagation. The stuck boards are searched by sudoku_bits,
+    in a pool of workers processes when workers is not 1."""
+    cands = parse_grids(grids)
+    status = propagate(cands)
+    results = [False] * len(cands)
+    for k in np.flatnonzero(status == solved):
+        results[k] = sudoku_bits.to_values(cands[k].tolist())
+    left = np.flatnonzero(status == stuck)
+    searched, wall = parallel.run(functools.partial(search_board, search_method=search_method),
+                                  (cands[k].tolist() for k in left), workers)
+    for k, values in zip(left, searched):
+        results[k] = values
+    return results, status
+
+
+################ System test ################
+
+def solve_all(grids, name='', search_method='Norvig Heuristic', workers=1):
+    """Solve a batch of grids and report the results, with the share done by propagation alone."""
+    grids = list(grids)
+    start = time.process_time()
+    results, status = solve_batch(grids, search_method, workers)
+    t = time.process_time() - start
+    N = len(grids)
+    if N >= 1:
+        print("Solved %d of %d %s puzzles in %.2f secs (%d Hz) - %s" % (
+            sum(sudoku.solved(v) for v in results), N, name, t, N / t if t else 999, search_method))
+        print("    propagation alone: %d solved, %d contradictions, %d left to search" % (
+            (status == solved).sum(), (status == contradiction).sum(), (status == stuck).sum()))
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    grids = sudoku.from_file('MesSudokus/top95.txt') + [sudoku.grid1, sudoku.hard1, '11' + '.' * 79]
+    cands = parse_grids(grids)
+    assert cands.shape == (len(grids), 81) and cands[-1, 0] == 1 and cands[-1, 2] == sudoku_bits.allbits
+    status = propagate(cands.copy())
+    assert status[-1] == contradiction and status[-3] == solved
+    ## Same rules, so same fixpoint as the scalar propagation
+    for k, grid in enumerate(grids[:-1]):
+        p = cands[k:k + 1].copy()
+        propagate_chunk(p)
+        assert p[0].tolist() == sudoku_bits.parse_grid(grid)
+    results, status = solve_batch(grids)
+    assert all(sudoku.solved(v) for v in results[:-1]) and results[-1] is False
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        solve_all(sudoku.from_file(sys.argv[1]), sys.argv[1], *sys.argv[2:3])
+    else:
+        test()
@@ -0,0 +1,208 @@
+## Reproducible benchmark of the search methods over the MesSudokus corpora
+
+## Runs every (method, corpus, seed) of a matrix: each run seeds random, solves a few
+## warmup puzzles (not measured), then solves the corpus `repeats` times, timing every
+## puzzle. The results are written as JSON and can be compared with a saved baseline:
+## a drop of throughput, a rise of latency or a lower solve rate beyond the threshold
+## is flagged as a regression (and makes the command exit with status 1).
+
+## A method is "engine:search method", e.g. "norvig:Norvig Heuristic", "bits:Brute Force",
+## "norvig:DLX", "wide:Norvig Heuristic" (the N x N engine on 9x9) or "hill:Simulated Annealing".
+
+## Usage: python sudoku_bench.py [-m method ...] [-c corpus ...] [-s seed ...] [-o results.json]
+##                               [--baseline baseline.json] [--threshold 0.10]
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import sudoku_bits
+import sudoku_norvig
+import sudoku_wide
+from sudoku_stats import Budget, SolveStats, percentile
+from sudoku_stream import read_puzzles
+
+default_methods = ('norvig:Brute Force', 'norvig:Norvig Heuristic', 'norvig:Norvig Improved', 'norvig:DLX',
+                   'bits:Norvig Heuristic')
+default_corpora = ('MesSudokus/easy50.txt', 'MesSudokus/top95.txt', 'MesSudokus/hardest.txt',
+                   'MesSudokus/1000sudoku.txt')
+hill_seconds = 5.0  # Give up limit of the hill climbing methods, per puzzle
+
+
+################ Solvers ################
+
+def solve_norvig(grid, method):
+    stats = SolveStats()
+    values = sudoku_norvig.solve(grid, method, stats=stats)
+    return sudoku_norvig.solved(values), stats.nodes
+
+
+def solve_bits(grid, method):
+    return sudoku_norvig.solved(sudoku_bits.solve(grid, method)), None
+
+
+def solve_wide(grid, method):
+    stats = SolveStats()
+    return sudoku_wide.solved(sudoku_wide.solve(grid, 3, method, stats)), stats.nodes
+
+
+def solve_hill(grid, method):
+    import sudoku_hill_class  # Imported on demand: needs colorama
+    sudoku = sudoku_hill_class.Sudoku(grid)
+    sudoku.solve(method, budget=Budget(max_seconds=hill_seconds))
+    return sudoku.is_solved(), sudoku.iterations
+
+
+engines = {'norvig': solve_norvig, 'bits': solve_bits, 'wide': solve_wide, 'hill': solve_hill}  # (grid, method) -> (solved, nodes)
+
+
+def solver(spec):
+    """Return the solver function of a method spec 'engine:search method'."""
+    engine, _, method = spec.partition(':')
+    if engine not in engines or not method:
+        raise ValueError(f"Unknown method {spec}. Use engine:search method, with engine in {sorted(engines)}")
+    return lambda grid: engines[engine](grid, method)
+
+
+################ Running ################
+
+def run_case(spec, corpus, seed, grids, warmup=5, repeats=3):
+    """Benchmark one method on one corpus with one seed. Return the result record (a dict)."""
+    solve = solver(spec)
+    random.seed(seed)
+    for grid in grids[:warmup]:
+        solve(grid)
+    latencies, rates, solved, nodes = [], [], 0, []
+    for r in range(repeats):
+        start = time.perf_counter()
+        for grid in grids:
+            t = time.perf_counter()
+            ok, n = solve(grid)
+            latencies.append(time.perf_counter() - t)
+            solved += ok
+            if n is not None:
+                nodes.append(n)
+        wall = time.perf_counter() - start
+        rates.append(len(grids) / wall if wall else 0.0)
+    latencies.sort()
+    return {'method': spec, 'corpus': corpus, 'seed': seed, 'puzzles': len(grids), 'repeats': repeats,
+            'throughput_hz': sorted(rates)[len(rates) // 2],  # median over the repeats
+            'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99), 'max': latencies[-1],
+            'solve_rate': solved / len(latencies),
+            'nodes_mean': sum(nodes) / len(nodes) if nodes else None,
+            'nodes_total': sum(nodes) if nodes else None}
+
+
+def run_matrix(methods=default_methods, corpora=default_corpora, seeds=(0,), warmup=5, repeats=3, limit=None,
+               verbose=True):
+    """Benchmark every (method, corpus, seed). Return {'meta': ..., 'results': [records]}."""
+    results = []
+    for corpus in corpora:
+        grids = list(read_puzzles(corpus))[:limit]
+        for spec in methods:
+            for seed in seeds:
+                record = run_case(spec, corpus, seed, grids, warmup, repeats)
+                results.append(record)
+                if verbose:
+                    print(format_record(record))
+    return {'meta': metadata(warmup, repeats, limit), 'results': results}
+
+
+def metadata(warmup, repeats, limit):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'machine': platform.machine(), 'processor': platform.processor(),
+            'warmup': warmup, 'repeats': repeats, 'limit': limit}
+
+
+def format_record(r):
+    return "%-28s %-26s seed %-3d %7.1f Hz  p50 %.4f  p95 %.4f  p99 %.4f  max %.4f secs  solved %5.1f%%%s" % (
+        r['method'], r['corpus'], r['seed'], r['throughput_hz'], r['p50'], r['p95'], r['p99'], r['max'],
+        100 * r['solve_rate'], '' if r['nodes_mean'] is None else '  nodes %.1f' % r['nodes_mean'])
+
+
+################ Baseline comparison ################
+
+def key(record):
+    return record['method'], record['corpus'], record['seed']
+
+
+def compare(results, baseline, threshold=0.10, solve_rate_tolerance=0.0):
+    """Compare two benchmark outputs. Return the list of regressions, as strings: throughput lower or
+    p95 latency higher than the baseline by more than threshold (a fraction, for the timing noise), or
+    solve rate lower by more than solve_rate_tolerance (absolute: by default any puzzle no longer solved)."""
+    base = dict((key(r), r) for r in baseline['results'])
+    regressions = []
+    for r in results['results']:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        name = '%s on %s (seed %d)' % key(r)
+        if r['throughput_hz'] < b['throughput_hz'] * (1 - threshold):
+            regressions.append('%s: throughput %.1f Hz < %.1f Hz' % (name, r['throughput_hz'], b['throughput_hz']))
+        if r['p95'] > b['p95'] * (1 + threshold):
+            regressions.append('%s: p95 latency %.4f > %.4f secs' % (name, r['p95'], b['p95']))
+        if r['solve_rate'] < b['solve_rate'] - solve_rate_tolerance:
+            regressions.append('%s: solve rate %.3f < %.3f' % (name, r['solve_rate'], b['solve_rate']))
+    return regressions
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    out = run_matrix(('norvig:Norvig Heuristic', 'bits:Brute Force'), ('MesSudokus/hardest.txt',), seeds=(1,),
+                     warmup=1, repeats=2, limit=5, verbose=False)
+    assert [r['method'] for r in out['results']] == ['norvig:Norvig Heuristic', 'bits:Brute Force']
+    assert all(r['solve_rate'] == 1.0 and r['puzzles'] == 5 for r in out['results'])
+    assert out['results'][0]['nodes_total'] > 0 and out['results'][1]['nodes_total'] is None
+    out = json.loads(json.dumps(out))
+    assert compare(out, out) == []
+    slower = json.loads(json.dumps(out))
+    slower['results'][0]['throughput_hz'] /= 2
+    assert len(compare(slower, out)) == 1
+    unsolved = json.loads(json.dumps(out))
+    unsolved['results'][0]['solve_rate'] = 0.91  # within the throughput threshold, but puzzles lost
+    assert len(compare(unsolved, out)) == 1 and compare(unsolved, out, solve_rate_tolerance=0.10) == []
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the search methods over the corpora.')
+    parser.add_argument('-m', '--method', action='append', help='engine:search method (repeatable)')
+    parser.add_argument('-c', '--corpus', action='append', help='puzzle file (repeatable)')
+    parser.add_argument('-s', '--seed', type=int, action='append', help='random seed (repeatable)')
+    parser.add_argument('--warmup', type=int, default=5, help='puzzles solved before measuring')
+    parser.add_argument('--repeats', type=int, default=3, help='measured passes over each corpus')
+    parser.add_argument('--limit', type=int, help='first puzzles of each corpus only')
+    parser.add_argument('-o', '--output', help='write the JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10, help='regression threshold (fraction)')
+    parser.add_argument('--solve-rate-tolerance', type=float, default=0.0,
+                        help='solve rate drop allowed (absolute, e.g. 0.05 for the local searches)')
+    parser.add_argument('--test', action='store_true', help='run the unit tests')
+    args = parser.parse_args()
+    if args.test:
+        test()
+        sys.exit()
+    out = run_matrix(args.method or default_methods, args.corpus or default_corpora, args.seed or (0,),
+                     args.warmup, args.repeats, args.limit)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(out, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(out, json.load(f), args.threshold, args.solve_rate_tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        print('%d regression(s) against %s' % (len(regressions), args.baseline))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,243 @@
+## Solve Every Sudoku Puzzle with candidate bitmasks
+
+## Same algorithm as sudoku.py / sudoku_norvig.py (see http://norvig.com/sudoku.html),
+## but the possible values are stored as 81 nine-bit integers in a flat list instead
+## of a dict of digit strings, so eliminating a digit never allocates a new string
+## and a search branch only copies a list of 81 ints.
+
+## Throughout this program we have:
+##   i is a square index, 0..80 (row-major: i = 9*row + col), e.g. 2 for 'A3'
+##   b is a digit bit,    e.g. 0b100000000 for '9'
+##   m is a mask of possible digits (bit k set when digit k+1 is possible)
+##   u is a unit,         a tuple of 9 square indexes
+##   grid is a grid,      e.g. 81 non-blank chars, e.g. starting with '.18...7...
+##   cands is a list of 81 masks, e.g. [0b100011111, 0b010000000, ...]
+##   values is a dict of possible values, e.g. {'A1':'12349', 'A2':'8', ...} (as in sudoku.py)
+
+import functools
+import random
+import time
+
+import sudoku
+import sudoku_parallel as parallel
+from sudoku_stats import Budget, exceeded
+from sudoku_topology import digits, squares, unitlist, units, peers
+
+allbits = (1 << 9) - 1
+
+bitcount = tuple(bin(m).count('1') for m in range(1 << 9))  # popcount of every mask
+lowbit = tuple(m & -m for m in range(1 << 9))  # lowest digit bit of every mask
+maskdigits = tuple(''.join(d for k, d in enumerate(digits) if m >> k & 1)
+                   for m in range(1 << 9))  # mask -> digit string, e.g. 0b101 -> '13'
+digitbit = dict((d, 1 << k) for k, d in enumerate(digits))
+
+search_methods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved'}
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    assert len(unitlist) == 27
+    assert all(len(units[i]) == 3 for i in range(81))
+    assert all(len(peers[i]) == 20 for i in range(81))
+    c2 = squares.index('C2')
+    assert tuple(tuple(squares[i] for i in u) for u in units[c2]) == sudoku.units['C2']
+    assert set(squares[i] for i in peers[c2]) == sudoku.peers['C2']
+    assert bitcount[0b101100000] == 3 and lowbit[0b101100000] == 0b000100000
+    assert maskdigits[0b100000101] == '139'
+    for method in search_methods:
+        assert sudoku.solved(solve(sudoku.grid1, method))
+        assert sudoku.solved(solve(sudoku.hard1, method))
+    assert solve(sudoku.hard1, 'Brute Force', Budget(max_nodes=3)) is exceeded
+    results = solve_all([sudoku.grid1, sudoku.hard1, sudoku.hard1], 'budget', None, 'Brute Force', 2, max_nodes=3)
+    assert sudoku.solved(results[0]) and results[1] is exceeded and results[2] is exceeded
+    print('All tests pass.')
+
+
+################ Parse a Grid ################
+
+def parse_grid(grid):
+    """Convert grid to a list of 81 candidate masks, or
+    return False if a contradiction is detected."""
+    cands = [allbits] * 81
+    for i, c in enumerate(grid_chars(grid)):
+        if c in digitbit and not assign(cands, i, digitbit[c]):
+            return False  ## (Fail if we can't assign d to square i.)
+    return cands
+
+
+def grid_chars(grid):
+    """Return the 81 meaningful chars of grid, with '0' or '.' for empties."""
+    chars = [c for c in grid if c in digits or c in '0.']
+    assert len(chars) == 81
+    return chars
+
+
+def to_values(cands):
+    """Convert a list of candidate masks to a values dict, as used by sudoku.py."""
+    if cands is False:
+        return False
+    return dict(zip(squares, (maskdigits[m] for m in cands)))
+
+
+################ Constraint Propagation ################
+
+def assign(cands, i, b):
+    """Eliminate all the other digits (except b) from cands[i] and propagate.
+    Return cands, except return False if a contradiction is detected."""
+    others = cands[i] & ~b
+    while others:
+        b2 = lowbit[others]
+        if not eliminate(cands, i, b2):
+            return False
+        others ^= b2
+    return cands
+
+
+def eliminate(cands, i, b):
+    """Eliminate b from cands[i]; propagate when values or places <= 2.
+    Return cands, except return False if a contradiction is detected."""
+    if not cands[i] & b:
+        return cands  ## Already eliminated
+    m = cands[i] = cands[i] & ~b
+    ## (1) If a square i is reduced to one value m, then eliminate m from the peers.
+    if m == 0:
+        return False  ## Contradiction: removed last value
+    elif bitcount[m] == 1:
+        for p in peers[i]:
+            if not eliminate(cands, p, m):
+                return False
+    ## (2) If a unit u is reduced to only one place for a value b, then put it there.
+    for u in units[i]:
+        place, n = -1, 0
+        for s in u:
+            if cands[s] & b:
+                place = s
+                n += 1
+                if n > 1:
+                    break
+        if n == 0:
+            return False  ## Contradiction: no place for this value
+        elif n == 1 and not assign(cands, place, b):
+            return False
+    return cands
+
+
+################ Search ################
+
+def solve(grid, search_method='Norvig Heuristic', budget=None):
+    """Solve grid and return a values dict (same shape as sudoku.py), or False
+    (or exceeded, when budget, a sudoku_stats.Budget, is exhausted)."""
+    cands = search(parse_grid(grid), search_method, budget)
+    return exceeded if cands is exceeded else to_values(cands)
+
+
+def search(cands, search_method, budget=None):
+    """Using depth-first search and propagation, try all possible values.
+    Return exceeded once budget is exhausted."""
+    if cands is False:
+        return False  ## Failed earlier
+    unfilled = [i for i in range(81) if bitcount[cands[i]] > 1]
+    if not unfilled:
+        return cands  ## Solved!
+    if budget is not None and budget.spend():
+        return exceeded  ## Out of budget
+
+    if search_method == 'Brute Force':
+        # choose a random unfilled square
+        i = random.choice(unfilled)
+    elif search_method == 'Norvig Heuristic':
+        # Chose the unfilled square i with the fewest possibilities
+        i = min(unfilled, key=lambda s: bitcount[cands[s]])
+    elif search_method == 'Norvig Improved':
+        i2, b2 = find_naked_pair_single(cands)
+        if i2 is not None:  # A naked pair leaves a single digit for i2
+            return search(assign(cands[:], i2, b2), search_method, budget)
+        i = min(unfilled, key=lambda s: bitcount[cands[s]])
+    else:
+        raise ValueError(
+            f"Unknown search method {search_method}. Available search methods are {search_methods}")
+
+    # try possible digits for i in random order
+    m = cands[i]
+    result = sudoku.some(search(assign(cands[:], i, b), search_method, budget)
+                         for b in sudoku.shuffled(1 << k for k in range(9) if m >> k & 1))
+    if not result and budget is not None and budget.reason:
+        return exceeded  ## (the branches after the exhaustion returned at once)
+    return result
+
+
+def find_naked_pair_single(cands):
+    """Look for a naked pair (two squares of a unit with the same two possible digits)
+    that leaves a single digit in another square of that unit.
+    Return (square, digit bit), or (None, None) when there is none."""
+    for u in unitlist:
+        pairs = [cands[s] for s in u if bitcount[cands[s]] == 2]
+        for k, m in enumerate(pairs):
+            if m not in pairs[k + 1:]:
+                continue
+            for s in u:
+                rest = cands[s] & ~m
+                if cands[s] != m and rest != cands[s] and bitcount[rest] == 1:
+                    return s, rest
+    return None, None
+
+
+################ System test ################
+
+def time_solve(grid, search_method, max_nodes=None, max_seconds=None):
+    """Solve grid and return (CPU seconds, values), within a Budget of max_nodes search nodes and
+    max_seconds of wall clock when they are not None. Module-level so that solve_all can run it in
+    worker processes."""
+    budget = Budget(max_nodes, max_seconds) if max_nodes is not None or max_seconds is not None else None
+    start = time.process_time()
+    values = solve(grid, search_method, budget)
+    return time.process_time() - start, values
+
+
+def solve_all(grids, name='', showif=0.0, search_method='Norvig Heuristic', workers=1, max_nodes=None,
+              max_seconds=None):
+    """Attempt to solve a sequence of grids. Report results and return the list of values.
+    When showif is a number of seconds, display puzzles that take longer.
+    When showif is None, don't display any puzzles.
+    When workers is not 1, the grids are solved in a pool of workers processes
+    (None for one per CPU).
+    max_nodes and max_seconds bound the search of each puzzle (see sudoku_stats.Budget): the puzzles
+    that run out of budget are counted apart from the ones without solution."""
+    if search_method not in search_methods:
+        raise ValueError(
+            f"Unknown search method {search_method}. Available search methods are {search_methods}")
+
+    grids = list(grids)
+    timed, wall = parallel.run(
+        functools.partial(time_solve, search_method=search_method, max_nodes=max_nodes, max_seconds=max_seconds),
+        grids, workers)
+    for grid, (t, values) in zip(grids, timed):
+        ## Display puzzles that take long enough
+        if showif is not None and t > showif:
+            sudoku.display(sudoku.grid_values(grid))
+            if values:
+                sudoku.display(values)
+            print('(%.2f seconds)\n' % t)
+    times = [t for t, values in timed]
+    results = [sudoku.solved(values) for t, values in timed]
+    N = len(grids)
+    hz = N / sum(times) if sum(times) != 0.0 else 999
+    if N >= 1:
+        print("Solved %d of %d %s puzzles in %.2f secs (avg %.4f secs (%d Hz), max %.2f secs). - %s" % (
+            sum(results), N, name, sum(times), sum(times) / N, hz, max(times), search_method))
+        over_budget = sum(values is exceeded for t, values in timed)
+        if max_nodes is not None or max_seconds is not None:
+            print("    budget exceeded %d - no solution %d (budget: %s nodes, %s secs)" % (
+                over_budget, N - sum(results) - over_budget, max_nodes, max_seconds))
+        parallel.report(N, wall, sum(times), workers)
+    return [values for t, values in timed]
+
+
+if __name__ == '__main__':
+    test()
+    # solve_all(sudoku.from_file("MesSudokus/easy50.txt"), "easy50 ", 1.0, 'Norvig Heuristic')
+    # solve_all(sudoku.from_file("MesSudokus/top95.txt"), "top95  ", 1.0, 'Norvig Heuristic')
+    # solve_all(sudoku.from_file("MesSudokus/hardest.txt"), "hardest", 1.0, 'Norvig Heuristic')
+    # solve_all(sudoku.from_file("MesSudokus/1000sudoku.txt"), "1000puz", 1.0, 'Norvig Heuristic')
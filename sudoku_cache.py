@@ -0,0 +1,218 @@
+## Solution cache keyed by the canonical form of a puzzle
+
+## Two puzzles that differ only by a Sudoku symmetry (digit relabeling, row
+## permutation within a band, band permutation, the same for columns and stacks,
+## and transposition) have the same solutions, up to the same symmetry. The cache
+## stores one solution per canonical form and maps it back to each variant.
+
+## Throughout this module we have:
+##   grid is an 81-char string with '.' for empties (any grid is normalized first)
+##   a transform is (transposed, rows, cols, labels): output square (i, j) holds the input
+##   square (rows[i], cols[j]) of the (transposed if needed) input, with digit d written labels[d]
+
+## The canonical form is the smallest relabeled grid string over the transforms that sort
+## bands, rows, stacks and columns by invariant keys (number of givens and the counts of the
+## crossing lines); only ties are enumerated. It is exact for the puzzles whose ties leave at
+## most max_transforms candidates, and falls back to the puzzle itself (no symmetric hits,
+## but still correct) otherwise.
+
+import collections
+import itertools
+import sys
+
+from sudoku_stats import exceeded
+from sudoku_topology import squares
+
+max_transforms = 2000
+
+
+################ Canonical form ################
+
+def normalize(grid):
+    """Return grid as 81 chars with '.' for empties."""
+    chars = ['.' if c in '0.' else c for c in grid if c in '0123456789.']
+    assert len(chars) == 81
+    return ''.join(chars)
+
+
+def transposed(grid):
+    return ''.join(grid[9 * c + r] for r in range(9) for c in range(9))
+
+
+def sorted_orders(items, key):
+    """Yield every order of items sorted by decreasing key (ties in any order)."""
+    groups = [list(g) for k, g in itertools.groupby(sorted(items, key=key, reverse=True), key=key)]
+    for parts in itertools.product(*(itertools.permutations(g) for g in groups)):
+        yield [item for part in parts for item in part]
+
+
+def line_orders(line_keys):
+    """Yield the orders of the 9 lines (rows or columns) of a grid that sort the 3 groups
+    (bands or stacks) and the lines within each group by decreasing key."""
+    def group_key(g):
+        return sorted(line_keys[3 * g + k] for k in range(3))
+    within = [list(sorted_orders(range(3 * g, 3 * g + 3), line_keys.__getitem__)) for g in range(3)]
+    for groups in sorted_orders(range(3), group_key):
+        for parts in itertools.product(*(within[g] for g in groups)):
+            yield [line for part in parts for line in part]
+
+
+def orientation_candidates(grid):
+    """Return (row orders, column orders) of grid allowed by the invariant keys."""
+    row_counts = [sum(grid[9 * r + c] != '.' for c in range(9)) for r in range(9)]
+    col_counts = [sum(grid[9 * r + c] != '.' for r in range(9)) for c in range(9)]
+    row_keys = [(row_counts[r], sorted(col_counts[c] for c in range(9) if grid[9 * r + c] != '.'))
+                for r in range(9)]
+    col_keys = [(col_counts[c], sorted(row_counts[r] for r in range(9) if grid[9 * r + c] != '.'))
+                for c in range(9)]
+    return list(line_orders(row_keys)), list(line_orders(col_keys)), row_keys, col_keys
+
+
+def relabel(chars):
+    """Relabel the digits of chars in order of first appearance. Return (string, labels)."""
+    labels = {}
+    out = []
+    for c in chars:
+        if c != '.' and c not in labels:
+            labels[c] = str(len(labels) + 1)
+        out.append(labels.get(c, '.'))
+    return ''.join(out), labels
+
+
+def canonical_form(grid):
+    """Return (canonical grid, transform) such that apply(transform, grid) == canonical grid."""
+    grid = normalize(grid)
+    candidates = []
+    for transpose in (False, True):
+        g = transposed(grid) if transpose else grid
+        row_orders, col_orders, row_keys, col_keys = orientation_candidates(g)
+        candidates.append((transpose, g, row_orders, col_orders, sorted(row_keys, reverse=True)))
+    ## Both orientations must agree on the invariant keys of the output rows to compete
+    best_keys = min(c[4] for c in candidates)
+    if sum(len(c[2]) * len(c[3]) for c in candidates if c[4] == best_keys) > max_transforms:
+        key, labels = relabel(grid)
+        return key, (False, list(range(9)), list(range(9)), labels)
+    best = None
+    for transpose, g, row_orders, col_orders, keys in candidates:
+        if keys != best_keys:
+            continue
+        for rows in row_orders:
+            for cols in col_orders:
+                key, labels = relabel(g[9 * r + c] for r in rows for c in cols)
+                if best is None or key < best[0]:
+                    best = (key, (transpose, rows, cols, labels))
+    return best
+
+
+def completed(labels):
+    """Return labels extended to the digits absent from the puzzle, which get the remaining labels
+    in order (any pairing is fine: such digits can be swapped in a solution)."""
+    labels = dict(labels)
+    free = sorted(set('123456789') - set(labels.values()))
+    for d, label in zip(sorted(set('123456789') - set(labels)), free):
+        labels[d] = label
+    return labels
+
+
+def apply(transform, grid):
+    """Apply transform to grid (a puzzle or a solution)."""
+    transpose, rows, cols, labels = transform
+    labels = completed(labels)
+    g = transposed(normalize(grid)) if transpose else normalize(grid)
+    return ''.join(labels.get(g[9 * r + c], '.') for r in rows for c in cols)
+
+
+def invert(transform, grid):
+    """Map grid back through the inverse of transform (e.g. a canonical solution to the original)."""
+    transpose, rows, cols, labels = transform
+    unlabels = dict((v, k) for k, v in completed(labels).items())
+    out = [''] * 81
+    for i, r in enumerate(rows):
+        for j, c in enumerate(cols):
+            out[9 * r + c] = unlabels.get(grid[9 * i + j], '.')
+    out = ''.join(out)
+    return transposed(out) if transpose else out
+
+
+################ Cache ################
+
+class SolutionCache:
+    """A size-bounded LRU cache of solutions keyed by canonical puzzle form.
+    Use cache.solve(grid, solver) where solver(grid) returns a values dict or False."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # canonical grid -> canonical solution string or False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def solve(self, grid, solver):
+        """Return the values dict solving grid, from the cache or computed with solver."""
+        key, transform = canonical_form(grid)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            solution = self.entries[key]
+            if solution is False:
+                return False
+            return dict(zip(squares, invert(transform, solution)))
+        self.misses += 1
+        values = solver(grid)
+        if values is exceeded:
+            return values  ## Out of budget: not known to have no solution, not cached
+        solution = False
+        if values:
+            solution = apply(transform, ''.join(values[s] for s in squares))
+        self.entries[key] = solution
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return values
+
+    def stats(self):
+        """Return a dict with the hit rate, evictions, entries and approximate memory in bytes."""
+        lookups = self.hits + self.misses
+        memory = sys.getsizeof(self.entries) + sum(
+            sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.entries.items())
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'evictions': self.evictions,
+                'entries': len(self.entries), 'memory_bytes': memory}
+
+    def clear(self):
+        self.entries.clear()
+
+
+################ Unit Tests ################
+
+def random_symmetry(grid, rng):
+    """Return grid under a random symmetry (for the tests)."""
+    bands, stacks = rng.sample(range(3), 3), rng.sample(range(3), 3)
+    rows = [3 * b + r for b in bands for r in rng.sample(range(3), 3)]
+    cols = [3 * s + c for s in stacks for c in rng.sample(range(3), 3)]
+    digits = dict(zip('123456789', rng.sample('123456789', 9)))
+    g = transposed(normalize(grid)) if rng.random() < 0.5 else normalize(grid)
+    return ''.join(digits.get(g[9 * r + c], '.') for r in rows for c in cols)
+
+
+def test():
+    """A set of tests that must pass."""
+    import random
+    import sudoku_bits
+    from sudoku import from_file, solved
+    rng = random.Random(3335)
+    cache = SolutionCache(max_entries=50)
+    for grid in from_file('MesSudokus/top95.txt')[:20]:
+        key, transform = canonical_form(grid)
+        assert apply(transform, grid) == key and invert(transform, key) == normalize(grid)
+        variant = random_symmetry(grid, rng)
+        assert canonical_form(variant)[0] == key
+        assert solved(cache.solve(grid, sudoku_bits.solve))
+        values = cache.solve(variant, sudoku_bits.solve)
+        assert solved(values) and all(c == '.' or values[s] == c for s, c in zip(squares, variant))
+    assert cache.stats()['hits'] == 20 and cache.stats()['misses'] == 20
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,145 @@
+## Compact binary puzzle corpus, read through a memory map
+
+## The text corpora of MesSudokus/ (one 81-char line per puzzle) are re-parsed
+## character by character on every run. This format packs each puzzle at 4 bits
+## per cell (0 for an empty square, 1..9 for a digit), high nibble first, in a
+## fixed-size record of 41 bytes. Records follow a 16-byte header, so the offset
+## index of puzzle k is simply header_size + k * record_size: random access and
+## sharding across workers need no scan of the file.
+
+## Header: magic b'SDK1', record size (uint16), cells per puzzle (uint16), count (uint64), little endian.
+
+## Usage: python sudoku_corpus.py convert MesSudokus/top95.txt top95.sdk
+##        python sudoku_corpus.py cat top95.sdk [start [stop]]
+
+import mmap
+import struct
+import sys
+
+from sudoku_stream import read_puzzles
+
+magic = b'SDK1'
+header = struct.Struct('<4sHHQ')
+cells = 81
+record_size = (cells + 1) // 2  # 41 bytes per puzzle
+nibble = dict((c, int(c)) for c in '0123456789')
+nibble['.'] = 0
+bytechars = tuple('.123456789ABCDEF'[b >> 4] + '.123456789ABCDEF'[b & 15] for b in range(256))  # byte -> 2 cells
+
+
+################ Writing ################
+
+def encode(grid):
+    """Pack a grid (81 digits, '0' or '.') into a record of 41 bytes."""
+    chars = [c for c in grid if c in nibble]
+    assert len(chars) == cells
+    values = [nibble[c] for c in chars] + [0]  # pad to an even number of cells
+    return bytes(values[k] << 4 | values[k + 1] for k in range(0, len(values) - 1, 2))
+
+
+def decode(record):
+    """Unpack a record (bytes or memoryview) into an 81-char grid with '.' for empties."""
+    return ''.join([bytechars[b] for b in record])[:cells]
+
+
+def write_corpus(grids, filename):
+    """Write the grids (any iterable, consumed lazily) to a binary corpus file. Return the count."""
+    count = 0
+    with open(filename, 'wb') as f:
+        f.write(header.pack(magic, record_size, cells, 0))  # count is patched at the end
+        for grid in grids:
+            f.write(encode(grid))
+            count += 1
+        f.seek(0)
+        f.write(header.pack(magic, record_size, cells, count))
+    return count
+
+
+def convert(text_filename, filename):
+    """Convert a text corpus (one puzzle per line) to a binary corpus. Return the count."""
+    return write_corpus(read_puzzles(text_filename), filename)
+
+
+################ Reading ################
+
+class Corpus:
+    """A binary corpus mapped in memory. corpus[k] is the grid of puzzle k (a string);
+    corpus.record(k) is its packed record as a zero-copy memoryview of the map."""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        tag, size, n_cells, self.count = header.unpack_from(self.map, 0)
+        if tag != magic or size != record_size or n_cells != cells:
+            self.close()
+            raise ValueError(f"{filename} is not a sudoku corpus (version {magic})")
+        self.view = memoryview(self.map)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, k):
+        """Return the record of puzzle k, without copying."""
+        if not -self.count <= k < self.count:
+            raise IndexError(k)
+        offset = header.size + (k % self.count) * record_size
+        return self.view[offset:offset + record_size]
+
+    def __getitem__(self, k):
+        return decode(self.record(k))
+
+    def __iter__(self):
+        return self.grids()
+
+    def grids(self, start=0, stop=None):
+        """Yield the grids of puzzles start..stop-1."""
+        for k in range(start, self.count if stop is None else min(stop, self.count)):
+            yield self[k]
+
+    def shard(self, worker, workers):
+        """Return the range of puzzle indexes handled by worker (0..workers-1) out of workers."""
+        return range(worker * self.count // workers, (worker + 1) * self.count // workers)
+
+    def close(self):
+        if hasattr(self, 'view'):
+            self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    import os
+    import tempfile
+    grids = list(read_puzzles('MesSudokus/top95.txt'))
+    filename = os.path.join(tempfile.mkdtemp(), 'top95.sdk')
+    assert convert('MesSudokus/top95.txt', filename) == len(grids) == 95
+    assert os.path.getsize(filename) == header.size + 95 * record_size
+    with Corpus(filename) as corpus:
+        assert len(corpus) == 95
+        assert [g.replace('0', '.') for g in grids] == list(corpus)
+        assert corpus[-1] == grids[-1] and decode(encode(grids[3])) == grids[3]
+        assert sum(len(corpus.shard(w, 4)) for w in range(4)) == 95
+    os.remove(filename)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 4 and sys.argv[1] == 'convert':
+        print(f"{convert(sys.argv[2], sys.argv[3])} puzzles written to {sys.argv[3]}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'cat':
+        with Corpus(sys.argv[2]) as corpus:
+            start = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+            stop = int(sys.argv[4]) if len(sys.argv) > 4 else None
+            for grid in corpus.grids(start, stop):
+                print(grid)
+    else:
+        test()
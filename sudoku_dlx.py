@@ -0,0 +1,176 @@
+## Dancing Links (DLX) exact-cover search method
+
+## See Knuth, "Dancing Links" (https://arxiv.org/abs/cs/0011047).
+## A sudoku is an exact cover problem: choose 81 of the 729 candidates (square i
+## holds digit k) so that each of the 324 constraints is covered exactly once:
+##   cell i has a digit, row r has digit k, column c has digit k, box b has digit k.
+## Algorithm X searches the matrix through circular doubly linked lists, covering
+## and uncovering columns in place, so no state is copied at the search nodes.
+## The search is deterministic (always the column with the fewest candidates).
+
+## Throughout this module we have:
+##   i is a square index, 0..80 and k a digit index, 0..8 (the digit is k + 1)
+##   r is a candidate (matrix row), r = 9*i + k
+##   c is a column header node, 1..324 (node 0 is the root)
+##   x is any node; L, R, U, D are its links, C its column header, S the column sizes
+
+from sudoku_stats import exceeded
+from sudoku_topology import squares, row_of, col_of, box_of
+
+n_columns = 324
+
+
+def build_matrix():
+    """Build the links of the full matrix (729 candidates x 324 constraints) once.
+    Return (L, R, U, D, C, S, row_of_node) as lists, copied for each puzzle."""
+    L = [n_columns] + list(range(n_columns))
+    R = list(range(1, n_columns + 1)) + [0]
+    U = list(range(n_columns + 1))
+    D = list(range(n_columns + 1))
+    C = list(range(n_columns + 1))
+    S = [0] * (n_columns + 1)
+    row_of_node = [-1] * (n_columns + 1)
+    for r in range(729):
+        i, k = divmod(r, 9)
+        columns = (i, 81 + 9 * row_of[i] + k, 162 + 9 * col_of[i] + k, 243 + 9 * box_of[i] + k)
+        first = len(L)
+        for j, column in enumerate(columns):
+            c, x = column + 1, first + j
+            U.append(U[c])  # insert x at the bottom of column c
+            D.append(c)
+            D[U[c]] = x
+            U[c] = x
+            C.append(c)
+            S[c] += 1
+            L.append(first + (j - 1) % 4)
+            R.append(first + (j + 1) % 4)
+            row_of_node.append(r)
+    return L, R, U, D, C, S, row_of_node
+
+
+matrix = build_matrix()
+row_nodes = [n_columns + 1 + 4 * r for r in range(729)]  # first node of each candidate
+
+
+################ Search ################
+
+def search(grid, budget=None):
+    """Solve grid with Algorithm X. Return (values dict or False, number of search nodes).
+    When budget (a sudoku_stats.Budget) is exhausted, return (exceeded, nodes)."""
+    L, R, U, D, C, S = (list(a) for a in matrix[:6])
+    row_of_node = matrix[6]
+
+    def cover(c):
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(c):
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    ## The givens are chosen up front; a constraint covered twice is a contradiction
+    solution = []
+    covered = set()
+    chars = [c for c in grid if c in '0123456789.']
+    assert len(chars) == 81, f"A grid needs 81 squares, got {len(chars)}"
+    for i, ch in enumerate(chars):
+        if ch in '0.':
+            continue
+        x = row_nodes[9 * i + int(ch) - 1]
+        for j in range(x, x + 4):
+            if C[j] in covered:
+                return False, 0
+            covered.add(C[j])
+            cover(C[j])
+        solution.append(9 * i + int(ch) - 1)
+
+    nodes = 0
+    stack = []  # (column, chosen node) of each level of the search
+    c = None
+    while True:
+        if c is None:  # choose the column with the fewest candidates
+            if R[0] == 0:  # every constraint is covered: solved
+                break
+            if budget is not None and budget.spend():
+                return exceeded, nodes
+            nodes += 1
+            c, size, h = R[0], S[R[0]], R[R[0]]
+            while h != 0 and size > 1:
+                if S[h] < size:
+                    c, size = h, S[h]
+                h = R[h]
+            cover(c)
+            x = D[c]
+        else:  # backtrack: undo the last choice and try the next candidate of its column
+            j = L[x]
+            while j != x:
+                uncover(C[j])
+                j = L[j]
+            solution.pop()
+            x = D[x]
+        if x == c:  # no candidate left in column c
+            uncover(c)
+            if not stack:
+                return False, nodes
+            c, x = stack.pop()
+            continue
+        solution.append(row_of_node[x])
+        j = R[x]
+        while j != x:
+            cover(C[j])
+            j = R[j]
+        stack.append((c, x))
+        c = None
+
+    digits = [0] * 81
+    for r in solution:
+        digits[r // 9] = r % 9 + 1
+    return dict((squares[i], str(digits[i])) for i in range(81)), nodes
+
+
+def solve(grid, budget=None):
+    """Solve grid with DLX and return a values dict (same shape as sudoku.py), or False
+    (or exceeded, when budget is exhausted)."""
+    return search(grid, budget)[0]
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    from sudoku import from_file, grid1, hard1, solved
+    assert len(matrix[0]) == n_columns + 1 + 4 * 729
+    assert all(matrix[5][c] == 9 for c in range(1, n_columns + 1))
+    assert solved(solve(grid1)) and solved(solve(hard1))
+    assert all(solved(solve(g)) for g in from_file('MesSudokus/hardest.txt'))
+    assert solve('11' + '.' * 79) is False
+    for grid in '123', grid1 + '1':  ## Malformed grids are rejected, as by the other engines
+        try:
+            solve(grid)
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError('malformed grid accepted: %r' % grid)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,154 @@
+## Generator of puzzles with a unique solution
+
+## A puzzle starts as a random filled grid; its clues are then removed one by one
+## in random order, and a removal is kept only when the puzzle stays unique. The
+## check is incremental: the puzzle is already known to have the single solution
+## `solution`, so removing the clue d of square s keeps it unique exactly when the
+## puzzle without that clue has no solution with s != d, i.e. when propagation plus
+## a search for a first solution fails once d is eliminated from s. After one pass
+## over every square the puzzle is minimal (each remaining clue is needed), unless
+## the pass stops early at a target number of clues.
+
+## Every worker process gets its own seeds (seed, batch number), so a run is
+## reproducible whatever the number of workers, and the puzzles are streamed to the
+## output file in order as the batches complete.
+
+## Usage: python sudoku_generate.py count output.txt [-w workers] [--seed seed] [--clues target]
+
+import argparse
+import collections
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sudoku
+import sudoku_parallel as parallel
+import sudoku_topology as topology
+from sudoku import assign, count_values, eliminate, parse_grid, squares
+
+batch_size = 50  # Puzzles per task sent to a worker
+
+
+################ Generation ################
+
+def random_solution(rng):
+    """Return a random filled grid (81 digits), drawn with rng (a random.Random)."""
+    stack = [parse_grid('.' * 81)]
+    while stack:
+        values = stack.pop()
+        unfilled = [s for s in squares if len(values[s]) > 1]
+        if not unfilled:
+            return ''.join(values[s] for s in squares)
+        s = min(unfilled, key=lambda s: len(values[s]))
+        for d in rng.sample(values[s], len(values[s])):
+            child = assign(values.copy(), s, d)
+            if child:
+                stack.append(child)
+
+
+def stays_unique(puzzle, solution, i):
+    """True if puzzle (a unique puzzle with this solution, as a list) without the clue of square i
+    is still unique. puzzle[i] is '.' on return."""
+    d = solution[i]
+    puzzle[i] = '.'
+    ## Quick checks on the clues alone: the peers' clues leave only d for i (naked single),
+    ## or d has no other place in a unit of i (hidden single)
+    if len(set(puzzle[p] for p in topology.peers[i])) == 9:
+        return True
+    for u in topology.units[i]:
+        if not any(puzzle[j] == '.' and j != i and all(puzzle[p] != d for p in topology.peers[j]) for j in u):
+            return True
+    values = parse_grid(''.join(puzzle))
+    return count_values(eliminate(values, squares[i], d), limit=1) == 0
+
+
+def minimize(solution, rng, target=None):
+    """Remove the clues of a filled grid in random order while the puzzle stays unique.
+    Stop at target clues (None for a minimal puzzle). Return the puzzle, with '.' for empties."""
+    puzzle = list(solution)
+    clues = 81
+    for i in rng.sample(range(81), 81):
+        if target is not None and clues <= target:
+            break
+        if stays_unique(puzzle, solution, i):
+            clues -= 1
+        else:
+            puzzle[i] = solution[i]  ## The clue is needed
+    return ''.join(puzzle)
+
+
+def generate(rng, target=None):
+    """Return a new puzzle with a unique solution (minimal, or with about target clues)."""
+    return minimize(random_solution(rng), rng, target)
+
+
+def generate_batch(batch, seed=0, count=batch_size, target=None):
+    """Generate count puzzles from the seed (seed, batch). Module-level for the worker processes."""
+    rng = random.Random('%d/%d' % (seed, batch))
+    return [generate(rng, target) for _ in range(count)]
+
+
+################ Streaming to a file ################
+
+def generate_stream(count, seed=0, target=None, workers=1):
+    """Yield count puzzles, in a reproducible order. With workers != 1 (None for one per CPU), the
+    batches are generated in a pool of workers processes, with at most 4 batches per worker in flight."""
+    batches = [(b, min(batch_size, count - b * batch_size)) for b in range((count + batch_size - 1) // batch_size)]
+    if workers is None:
+        workers = parallel.default_workers()
+    if workers == 1:
+        for b, n in batches:
+            yield from generate_batch(b, seed, n, target)
+        return
+    in_flight = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for b, n in batches:
+            in_flight.append(pool.submit(generate_batch, b, seed, n, target))
+            if len(in_flight) >= 4 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def generate_file(filename, count, seed=0, target=None, workers=1):
+    """Write count puzzles to filename (one per line, as they are generated). Return the wall-clock seconds."""
+    start = time.perf_counter()
+    with open(filename, 'w') as f:
+        for puzzle in generate_stream(count, seed, target, workers):
+            f.write(puzzle + '\n')
+    return time.perf_counter() - start
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    rng = random.Random(3335)
+    solution = random_solution(rng)
+    assert sudoku.solved(sudoku.grid_values(solution))
+    puzzle = minimize(solution, rng)
+    assert sudoku.count_solutions(puzzle) == 1 and all(c in '.' + d for c, d in zip(puzzle, solution))
+    for i in range(81):  # minimal: no clue can be removed
+        if puzzle[i] != '.':
+            assert sudoku.count_solutions(puzzle[:i] + '.' + puzzle[i + 1:]) == 2
+    assert sum(c != '.' for c in minimize(solution, rng, target=40)) == 40
+    assert list(generate_stream(3, seed=7)) == generate_batch(0, 7, 3)
+    assert list(generate_stream(60, seed=7, target=50, workers=2))[50:] == generate_batch(1, 7, 10, target=50)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        parser = argparse.ArgumentParser(description='Generate puzzles with a unique solution.')
+        parser.add_argument('count', type=int)
+        parser.add_argument('output')
+        parser.add_argument('-w', '--workers', type=int, default=1, help='worker processes (0 for one per CPU)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clues', type=int, help='stop removing clues at this count (default: minimal)')
+        args = parser.parse_args()
+        wall = generate_file(args.output, args.count, args.seed, args.clues, args.workers or None)
+        print("%d puzzles written to %s in %.2f secs (%d per hour)" % (
+            args.count, args.output, wall, args.count / wall * 3600 if wall else 0))
+    else:
+        test()
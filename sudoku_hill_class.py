@@ -12,53 +12,76 @@ Throughout this program we have:
    u is a unit,   e.g. ['A1','B1','C1','D1','E1','F1','G1','H1','I1'] # unit_type can be 'row', 'column', or 'unit3x3'
    grid is a grid,e.g. 81 non-blank chars, e.g. starting with '.18...7...
    gv = grid_values is a dict of {square: char} with '0' or '.' for empties.
+   box is the size of the boxes: 3 for 9x9 boards (default), 2 to 5 for 4x4 to 25x25 boards, where
+   the digits are '123456789ABCDEFGHIJKLMNOP'[:box*box] and the squares are named 'A1'..'Y25'.
 
 firstsquaresofunit3x3 = cross('ADG', '147')  # list containing 9 squares: first per unit: ['A1', 'A4', 'A7'...
-searchMethods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved', 'Hill Climbing'}
+searchMethods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved', 'Hill Climbing', 'Simulated Annealing',
+                 'Tabu Search'}
 emptydigits = '0.'  # The digit values representing an empty square
 unit_types = ['row', 'column', 'unit3x3']  # unit_type can be 'row', 'column', or 'unit3x3'
 print_display = 'nothing'  # Values: ["nothing", "minimum", "init grid", "init and final grids", "all solution grids"]
 
 """
+import functools
+import math
 import random
 import time
 from colorama import Back, Style  # example: print(Fore.BLUE + displaystring)
 
+import sudoku_parallel as parallel
+import sudoku_topology as topology
+from sudoku_stats import Budget, percentile
+
+first_squares_of_unit3x3 = topology.standard.first_squares_of_boxes  # first square of each 3x3 unit: ['A1', 'A4', 'A7'...
+row_col = topology.standard.row_col  # {'A3': (0, 2)...
+
+
+def line_swap_delta(free, every, d_out, d_in):
+    """Returns the change of conflicts of a line (row or column) when a non initial square of the line
+       holding d_out now holds d_in. free and every are the digit counts of the line (see init_conflict_counts)."""
+    # A line contributes free[d] * (every[d] - 1) for each digit d
+    return ((free[d_out] - 1) * (every[d_out] - 2) - free[d_out] * (every[d_out] - 1) +
+            (free[d_in] + 1) * every[d_in] - free[d_in] * (every[d_in] - 1))
+
 
 class Sudoku:
 
-    def __init__(self, grid, showif=0.0):
+    def __init__(self, grid, showif=0.0, box=3):
+        # box is the size of the boxes ('3x3 units'): 2 to 5, for 4x4 to 25x25 boards
         self.showif = showif
-        self.cols = '123456789'
-        self.digits = '123456789'
+        self.box = box
+        self.topology = topology.topology(box)
+        self.n = self.topology.n  # number of digits, rows, columns and boxes
+        self.cols = self.topology.cols
+        self.digits = self.topology.digits
+        self.digit_index = dict((d, k + 1) for k, d in enumerate(self.digits))  # {'1': 1, ... 'A': 10...
         self.empty_digits = '0. '
-        self.rows = 'ABCDEFGHI'
+        self.rows = self.topology.rows
         self.unit_types = ['row', 'column', 'unit3x3']
-        self.squares = self.cross(self.rows, self.cols)
-        self.unit_list = (
-                [self.cross(self.rows, c) for c in self.cols] +
-                [self.cross(r, self.cols) for r in self.rows] +
-                [self.cross(rs, cs) for rs in ('ABC', 'DEF', 'GHI') for cs in ('123', '456', '789')]
-        )
-        self.units = dict(
-            (s, [u for u in self.unit_list if s in u]) for s in self.squares
-        )
-        self.peers = dict(
-            (s, set(sum(self.units[s], [])) - {s}) for s in self.squares
-        )
+        # The tables are shared by all puzzles (precomputed once per box size in sudoku_topology)
+        self.squares = self.topology.squares
+        self.unit_list = self.topology.named_unitlist
+        self.units = self.topology.named_units
+        self.peers = self.topology.named_peers
+        self.row_col = self.topology.row_col
         # Convert grid into a dict of {square: char} with '0' or '.' for empties.
         # Example: {'A1': '4', 'A2': '.', 'A3': '.', 'A4': '.', 'A5': '.', 'A6': '.', 'A7': '8', 'A8': '.', 'A9': ...
-        chars = [c for c in grid if c in self.cols or c in '0.']
-        assert len(chars) == 81
+        chars = [c for c in grid if c in self.digits or c in '0.']
+        assert len(chars) == self.topology.size
         self.grid = grid
         self.gv_init = self.grid_values()
         self.gv_current = self.gv_init.copy() # Need to use function copy()
         self.gv_conflicts = None
         self.conflictsDict = None
         self.total_conflicts = 0
-        self.first_squares_of_unit3x3 = self.cross('ADG', '147')
-        self.search_methods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved', 'Hill Climbing'}
+        self.first_squares_of_unit3x3 = self.topology.first_squares_of_boxes
+        self.search_methods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved', 'Hill Climbing',
+                               'Simulated Annealing', 'Tabu Search'}
         self.search_method = 'Hill Climbing'
+        self.restarts = 0  # Number of random restarts used by the last search (Simulated Annealing, Tabu Search)
+        self.iterations = 0  # Number of swaps tried by the last search (Simulated Annealing, Tabu Search)
+        self.exceeded = None  # 'nodes' or 'deadline' when the last search ran out of budget before a solution
 
     def cross(self, A, B):
         # Cross product of elements in A and elements in B.
@@ -72,13 +95,26 @@ class Sudoku:
         assert all(len(self.units[s]) == 3 for s in self.squares)
         assert all(len(self.peers[s]) == 20 for s in self.squares)
 
-        assert self.units['C2'] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
-                                    ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
-                                    ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
+        assert [list(u) for u in self.units['C2']] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
+                                                       ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
+                                                       ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
 
         assert self.peers['C2'] == {'A2', 'B2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2', 'C1', 'C3',
                                     'C4', 'C5', 'C6', 'C7', 'C8', 'C9', 'A1', 'A3', 'B1', 'B3'}
 
+        # The incremental conflicts are the same as eval_conflicts
+        self.fill_grid_randomly()
+        self.init_conflict_counts()
+        assert self.update_conflicts() == self.eval_conflicts()
+        squares, max_conflicts = self.squares_causing_max_conflicts()
+        assert max_conflicts == max(self.gv_conflicts.values()) and all(
+            self.gv_conflicts[s] == max_conflicts for s in squares)
+
+        # The wall clock limit of the local searches is the deadline of their Budget
+        for method in 'Simulated Annealing', 'Tabu Search':
+            self.solve(method, budget=Budget(max_seconds=0.01))
+            assert self.is_solved() or self.exceeded == 'deadline'
+
         return 'All tests pass.'
 
     ################ Parse a Grid ################
@@ -86,16 +122,16 @@ class Sudoku:
         """Convert grid into a dict of {square: char} with '0' or '.' for empties."""
         # Example: {'A1': '4', 'A2': '.', 'A3': '.', 'A4': '.', 'A5': '.', 'A6': '.', 'A7': '8', 'A8': '.', 'A9': ...
         chars = [c for c in self.grid if c in self.digits or c in '0.']
-        assert len(chars) == 81
+        assert len(chars) == self.topology.size
         return dict(zip(self.squares, chars))
 
     # Constraint functions
     def squares_causing_max_conflicts(self):
-        # Will receive a grid filled with values and a conflicts_grid_values and will return:
-        #   - a set of all squares having the maximum number of conflits
-        #   - the number of conflicts (int) for this maximum"""
-        max_conflicts = max(self.gv_conflicts)
-        return self.gv_conflicts[max_conflicts], max_conflicts
+        # Will use the conflicts dictionary of the last eval_conflicts (or update_conflicts) and will return:
+        #   - a list of all squares having the maximum number of conflits
+        #   - the number of conflicts (int) for this maximum
+        max_conflicts = max(self.conflictsDict)
+        return self.conflictsDict[max_conflicts], max_conflicts
 
     def is_initial_squares(self, s):
         # Will receive the initial grid and a square and return True if filled in the initial puzzle
@@ -228,16 +264,112 @@ class Sudoku:
 
         self.gv_conflicts = conflicts_grid_values
         self.total_conflicts = conflictvaluestotal
-        self.conflictsDict = conflicts_grid_values
+        self.conflictsDict = conflicts_dict
 
         return conflicts_grid_values, conflictvaluestotal, conflicts_dict
 
+    def update_conflicts(self):
+        """Same result and bookkeeping (gv_conflicts, conflictsDict) as eval_conflicts, computed from the row and
+           column counts of init_conflict_counts: a non initial square holding d is in conflict with the other
+           squares holding d in its row and in its column."""
+        conflicts_grid_values, conflicts_dict = {}, {}
+        for s in self.squares:
+            d = self.gv_current[s]
+            if self.is_initial_squares(s) or d in self.empty_digits:
+                conflict_value = 0
+            else:
+                d = self.digit_index[d]
+                r, c = self.row_col[s]
+                conflict_value = self.row_all_counts[r][d] + self.col_all_counts[c][d] - 2
+            conflicts_grid_values[s] = conflict_value
+            conflicts_dict.setdefault(conflict_value, []).append(s)
+        self.gv_conflicts = conflicts_grid_values
+        self.conflictsDict = conflicts_dict
+        return conflicts_grid_values, self.total_conflicts, conflicts_dict
+
+    # Incremental conflict scoring
+    def init_conflict_counts(self):
+        """Builds the per-row and per-column digit counts of the current grid and returns the total conflicts.
+           For each line (row or column) and digit d, we keep the number of squares holding d (all_counts) and
+           the number of non initial squares holding d (free_counts). Each non initial square holding d is in
+           conflict with the other squares of the line holding d, so the line contributes
+           free_counts * (all_counts - 1) to the total (same total as eval_conflicts)."""
+        n = self.n
+        self.row_all_counts = [[0] * (n + 1) for _ in range(n)]  # [row][digit index]
+        self.row_free_counts = [[0] * (n + 1) for _ in range(n)]
+        self.col_all_counts = [[0] * (n + 1) for _ in range(n)]  # [column][digit index]
+        self.col_free_counts = [[0] * (n + 1) for _ in range(n)]
+        for s in self.squares:
+            if self.gv_current[s] in self.empty_digits:
+                continue
+            d = self.digit_index[self.gv_current[s]]
+            r, c = self.row_col[s]
+            self.row_all_counts[r][d] += 1
+            self.col_all_counts[c][d] += 1
+            if not self.is_initial_squares(s):
+                self.row_free_counts[r][d] += 1
+                self.col_free_counts[c][d] += 1
+
+        self.total_conflicts = sum(
+            free[d] * (every[d] - 1)
+            for counts in ((self.row_free_counts, self.row_all_counts), (self.col_free_counts, self.col_all_counts))
+            for free, every in zip(*counts) for d in range(1, n + 1) if free[d]
+        )
+        return self.total_conflicts
+
+    def swap_conflicts_delta(self, s1, s2):
+        """Returns the change of total conflicts if the (non initial) squares s1 and s2 were swapped, in O(1).
+           Only the rows and columns of s1 and s2 and the two swapped digits are involved."""
+        d1, d2 = self.digit_index[self.gv_current[s1]], self.digit_index[self.gv_current[s2]]
+        if d1 == d2:
+            return 0
+        (r1, c1), (r2, c2) = self.row_col[s1], self.row_col[s2]
+        delta = 0
+        if r1 != r2:
+            delta += line_swap_delta(self.row_free_counts[r1], self.row_all_counts[r1], d1, d2)
+            delta += line_swap_delta(self.row_free_counts[r2], self.row_all_counts[r2], d2, d1)
+        if c1 != c2:
+            delta += line_swap_delta(self.col_free_counts[c1], self.col_all_counts[c1], d1, d2)
+            delta += line_swap_delta(self.col_free_counts[c2], self.col_all_counts[c2], d2, d1)
+        return delta
+
+    def swap(self, s1, s2, delta=None):
+        """Swaps the (non initial) squares s1 and s2 in gv_current and updates the counts and total conflicts
+           in place. delta can be given when already computed with swap_conflicts_delta."""
+        if delta is None:
+            delta = self.swap_conflicts_delta(s1, s2)
+        d1, d2 = self.digit_index[self.gv_current[s1]], self.digit_index[self.gv_current[s2]]
+        (r1, c1), (r2, c2) = self.row_col[s1], self.row_col[s2]
+        for counts, i1, i2 in ((self.row_all_counts, r1, r2), (self.row_free_counts, r1, r2),
+                               (self.col_all_counts, c1, c2), (self.col_free_counts, c1, c2)):
+            counts[i1][d1] -= 1
+            counts[i1][d2] += 1
+            counts[i2][d2] -= 1
+            counts[i2][d1] += 1
+        self.gv_current[s1], self.gv_current[s2] = self.gv_current[s2], self.gv_current[s1]
+        self.total_conflicts += delta
+
+    def swappable_pairs(self):
+        """Returns a sorted list of the pairs (tuple) of non initial squares within the same 3x3 unit.
+           Example: [('A3', 'B1'), ('A3', 'B3'), ('A3', 'C3')..."""
+        all_swappables_squares = self.non_initial_squares_set()  # Will only consider non initial squares as swappable
+        set_of_swappable_pairs = set()
+        for s in all_swappables_squares:
+            possible_swaps = set(self.squares_within_unit_list(s, 'unit3x3')) - {s}  # squares in unit, except s
+            for s2 in possible_swaps.intersection(all_swappables_squares):  # only swappable squares
+                # The first element of the pair will always be the smallest.
+                set_of_swappable_pairs.add((s, s2) if s < s2 else (s2, s))
+        return sorted(set_of_swappable_pairs)
+
     # Display as 2-D grid
     def display_gv(self, show_conflicts=True):
         """Display grid_values as a 2-D grid. If only display a initialgrid, you can pass currentgrid = initialgrid.
            Same as displaygrid(), but used dictionnary gridvalues instead"""
         width = 3  # No need to display the possible values
-        line = '+'.join(['-' * (width * 3)] * 3)
+        line = '+'.join(['-' * (width * self.box)] * self.box)
+        last_cols = set(self.cols[self.box - 1:-1:self.box])  # separator after these columns: {'3', '6'}
+        last_rows = set(self.rows[self.box - 1:-1:self.box])  # and these rows: {'C', 'F'}
+        last_col = self.cols[-1]
 
         if show_conflicts:  # Will evaluate conflicts in order to show them
             self.gv_conflicts, nb_conflicts, conflicts_grid_values = self.eval_conflicts()
@@ -254,8 +386,8 @@ class Sudoku:
                 # Will highlight numbers from initial grid   emptydigits = '0.'
                 displaystring += (Back.BLACK if self.gv_init[r + c] not in self.empty_digits else Style.RESET_ALL)
                 displaystring += ' ' + str(self.gv_current[r + c]) + ' '
-                displaystring += Style.RESET_ALL + ('|' if c in '36' else '') + (
-                    '\n' if (c in '9') and (not show_conflicts) else '')  # separator after a group of 3 columns
+                displaystring += Style.RESET_ALL + ('|' if c in last_cols else '') + (
+                    '\n' if (c == last_col) and (not show_conflicts) else '')  # separator after a group of 3 columns
             if show_conflicts:  # displays the value_grid
                 displaystring += '    '
                 for c2 in self.cols:
@@ -263,22 +395,35 @@ class Sudoku:
                     displaystring += (Back.BLACK if self.gv_init[r + c2] not in self.empty_digits else Style.RESET_ALL)
                     displaystring += ' ' + str(self.gv_conflicts[r + c2]) + ' '
                     # Display for a column
-                    displaystring += Style.RESET_ALL + ('|' if c2 in '36' else '') + ('\n' if c2 in '9' else '')
+                    displaystring += Style.RESET_ALL + ('|' if c2 in last_cols else '') + ('\n' if c2 == last_col else '')
 
-            if r in 'CF': displaystring = displaystring + line + ('    ' + line if show_conflicts else '') + '\n'
+            if r in last_rows: displaystring = displaystring + line + ('    ' + line if show_conflicts else '') + '\n'
         print(displaystring)
 
     # Search
-    def solve(self, search_method, verbose=False):
+    def solve(self, search_method, verbose=False, budget=None, **options):
+        """Will solve a puzzle with the appropriate search method.
+           budget (a sudoku_stats.Budget) bounds the iterations and time of either method: when it runs out
+           before a solution, self.exceeded says why.
+           options are passed to the search method (see improve_solution_simulated_annealing and
+           improve_solution_tabu_search)."""
         self.search_method = search_method
-        # Will solve a puzzle with the appropriate search method
+        self.exceeded = None
         self.fill_grid_randomly()  # Fills all the 3x3 units randomly with unused numbers in unit
 
         if verbose in ['init grid', 'init and final grids', 'all solution grids']:
             self.display_gv(True)
 
         if self.search_method == 'Hill Climbing':
-            self.gv_current = self.improve_solution_hill_climb_calc_all_swaps3x3(verbose)
+            self.gv_current = self.improve_solution_hill_climb_calc_all_swaps3x3(verbose, budget)
+            if verbose in ['init and final grids', 'all solution grids']:
+                self.display_gv()
+        elif self.search_method == 'Simulated Annealing':
+            self.gv_current = self.improve_solution_simulated_annealing(verbose, budget=budget, **options)
+            if verbose in ['init and final grids', 'all solution grids']:
+                self.display_gv()
+        elif self.search_method == 'Tabu Search':
+            self.gv_current = self.improve_solution_tabu_search(verbose, budget=budget, **options)
             if verbose in ['init and final grids', 'all solution grids']:
                 self.display_gv()
         else:
@@ -287,56 +432,180 @@ class Sudoku:
             )
         return self.gv_init, self.gv_current
 
-    def improve_solution_hill_climb_calc_all_swaps3x3(self, verbose):
+    def improve_solution_hill_climb_calc_all_swaps3x3(self, verbose, budget=None):
         """Receives a puzzle with conflicts and tries to decrease the number of conflicts by swapping 2 values
            using the Hill Climbing method.
-           Will calculate total conflict for all possible swaps of a pair within a 3x3 unit and then choose the best"""
-
-        # Create a list of swappable pairs (tuple) for each unit (not part of initial square)
-        all_swappables_squares = self.non_initial_squares_set()  # Will only consider non initial squares as swappable
-        set_of_swappable_pairs = set()  # Example: {('A3', 'B1'), ('A3', 'B3'), ('A3', 'C3')...
-        for r in self.rows:
-            for c in self.cols:
-                if r + c in all_swappables_squares:
-                    # Will loop for all combinations within units
-                    possible_swaps = set(
-                        self.squares_within_unit_list(r + c, 'unit3x3')
-                    ) - {r + c}  # squares in unit, except current
-                    possible_swaps = possible_swaps.intersection(all_swappables_squares)  # only swappable squares
-                    for s in possible_swaps:
-                        # Will insert the pairs in a set, and the first element of the pair will always be the smallest.
-                        if r + c < s:
-                            set_of_swappable_pairs.add((r + c, s))
-                        else:
-                            set_of_swappable_pairs.add((s, r + c))
-
-        # Will simulate each swap, calculate the total conflicts for each swap and choose the best
-        best_puzzle = self.gv_current
-        current_total_conflicts = self.count_conflicts(best_puzzle)
-        best_total_conflicts = current_total_conflicts
+           Will calculate total conflict for all possible swaps of a pair within a 3x3 unit and then choose the best.
+           The change of conflicts of each swap is computed incrementally from the row and column counts.
+           Each swap spends one node of budget (a sudoku_stats.Budget), if any."""
+        set_of_swappable_pairs = self.swappable_pairs()  # Example: [('A3', 'B1'), ('A3', 'B3'), ('A3', 'C3')...
+        self.init_conflict_counts()
 
         while True:  # Loop until a maximum is found
+            if budget is not None and self.total_conflicts and budget.spend():
+                self.exceeded = budget.reason
+                return self.gv_current
+            best_delta, best_pair = 0, None
             for pair in set_of_swappable_pairs:
-                test_puzzle = self.gv_current.copy()
-                # swap the 2 values
-                test_puzzle[pair[0]], test_puzzle[pair[1]] = self.gv_current[pair[1]], self.gv_current[pair[0]]
-                if self.count_conflicts(test_puzzle) < best_total_conflicts:  # found a better candidate
-                    best_total_conflicts = self.count_conflicts(test_puzzle)
-                    best_puzzle = test_puzzle
-
-            if best_total_conflicts == current_total_conflicts:  # no improvement (local maximum or solution)
+                delta = self.swap_conflicts_delta(*pair)
+                if delta < best_delta:  # found a better candidate
+                    best_delta, best_pair = delta, pair
+
+            if best_pair is None:  # no improvement (local maximum or solution)
                 if verbose:
-                    print(f'FINAL SOLUTION: found maximum with {best_total_conflicts} conflicts.')
+                    print(f'FINAL SOLUTION: found maximum with {self.total_conflicts} conflicts.')
                 return self.gv_current
             else:  # will try to improve
-                self.gv_current = best_puzzle
-                current_total_conflicts = best_total_conflicts
-                if verbose:
-                    print(f'Swapping{pair} and total conflicts is now {best_total_conflicts}')
+                self.swap(*best_pair, best_delta)
                 if verbose:
+                    print(f'Swapping{best_pair} and total conflicts is now {self.total_conflicts}')
                     self.display_gv()
 
 
+    def improve_solution_simulated_annealing(self, verbose, initial_temperature=0.6, cooling_rate=0.99999,
+                                             min_temperature=0.35, reheat_after=50000, restart_after=10,
+                                             max_iterations=2000000, budget=None):
+        """Receives a puzzle with conflicts and tries to reach 0 conflicts with Simulated Annealing over the
+           same neighborhood as Hill Climbing (swap of 2 non initial squares within a 3x3 unit).
+           - A random swap is always accepted if it doesn't add conflicts, and with probability exp(-delta/T)
+             otherwise. T starts at initial_temperature and is multiplied by cooling_rate after each swap,
+             down to min_temperature.
+           - Reheat: if the best number of conflicts didn't improve for reheat_after swaps, T goes back to
+             initial_temperature.
+           - Restart: after restart_after reheats without improvement, the grid is filled randomly again.
+           - Budget: stops after max_iterations swaps, or when budget (a sudoku_stats.Budget: one node per swap,
+             and its max_seconds of wall clock) runs out; self.exceeded then says why.
+           Returns the best grid found (a solution if total_conflicts is 0)."""
+        set_of_swappable_pairs = self.swappable_pairs()
+        self.init_conflict_counts()
+        best_grid, best_conflicts = self.gv_current.copy(), self.total_conflicts
+        if not set_of_swappable_pairs or best_conflicts == 0:
+            return self.gv_current
+
+        temperature = initial_temperature
+        last_improvement, reheats = 0, 0
+        self.restarts = 0
+        for self.iterations in range(1, max_iterations + 1):
+            if budget is not None and budget.spend():
+                break
+            pair = random.choice(set_of_swappable_pairs)
+            delta = self.swap_conflicts_delta(*pair)
+            if delta <= 0 or random.random() < math.exp(-delta / temperature):
+                self.swap(*pair, delta)
+                if self.total_conflicts < best_conflicts:
+                    best_grid, best_conflicts = self.gv_current.copy(), self.total_conflicts
+                    last_improvement, reheats = self.iterations, 0
+                    if best_conflicts == 0:  # solution found
+                        break
+            temperature = max(temperature * cooling_rate, min_temperature)
+
+            if self.iterations - last_improvement >= reheat_after:  # stagnation
+                last_improvement = self.iterations
+                reheats += 1
+                temperature = initial_temperature
+                if reheats >= restart_after:  # random restart
+                    reheats = 0
+                    self.restarts += 1
+                    self.fill_grid_randomly()
+                    self.init_conflict_counts()
+                if verbose:
+                    print(f'Reheat after {self.iterations} swaps ({self.restarts} restarts), '
+                          f'best total conflicts is {best_conflicts}')
+        else:
+            self.exceeded = 'nodes'  # max_iterations
+        if budget is not None and budget.reason:
+            self.exceeded = budget.reason
+        if best_conflicts == 0:
+            self.exceeded = None
+
+        if verbose:
+            print(f'FINAL SOLUTION: found {best_conflicts} conflicts after {self.iterations} swaps '
+                  f'and {self.restarts} restarts.')
+        self.gv_current = best_grid
+        self.init_conflict_counts()  # counts of the best grid
+        return self.gv_current
+
+    def improve_solution_tabu_search(self, verbose, tabu_tenure=7, restart_after=3000, max_iterations=2000000,
+                                     budget=None):
+        """Receives a puzzle with conflicts and tries to reach 0 conflicts with Tabu Search over the same
+           neighborhood as Hill Climbing (swap of 2 non initial squares within a 3x3 unit).
+           - Each iteration looks at the swaps of the squares causing the most conflicts (see
+             squares_causing_max_conflicts) with the other non initial squares of their 3x3 unit, and makes
+             the best one even if it is sideways or uphill (ties are broken randomly).
+           - Tabu: a swap can't give a square back the digit it just lost for tabu_tenure iterations, unless it
+             gives fewer conflicts than the best grid since the last restart (aspiration).
+           - Restart: after restart_after iterations without improvement, the grid is filled randomly again.
+           - Budget: stops after max_iterations swaps, or when budget (a sudoku_stats.Budget: one node per swap,
+             and its max_seconds of wall clock) runs out; self.exceeded then says why.
+           Returns the best grid found (a solution if total_conflicts is 0)."""
+        partners = {}  # {square: the non initial squares of its 3x3 unit}
+        for s1, s2 in self.swappable_pairs():
+            partners.setdefault(s1, []).append(s2)
+            partners.setdefault(s2, []).append(s1)
+        self.init_conflict_counts()
+        best_grid, best_conflicts = self.gv_current.copy(), self.total_conflicts
+        if not partners or best_conflicts == 0:
+            return self.gv_current
+
+        tabu = {}  # {(square, digit): last iteration where putting digit back in square is tabu}
+        restart_best, last_improvement = best_conflicts, 0
+        self.restarts = 0
+        for self.iterations in range(1, max_iterations + 1):
+            if budget is not None and budget.spend():
+                break
+            self.update_conflicts()
+            squares, max_conflicts = self.squares_causing_max_conflicts()
+            best_delta, moves = None, []
+            for s1 in squares:
+                for s2 in partners.get(s1, ()):
+                    delta = self.swap_conflicts_delta(s1, s2)
+                    if (tabu.get((s1, self.gv_current[s2]), 0) >= self.iterations or
+                            tabu.get((s2, self.gv_current[s1]), 0) >= self.iterations) and \
+                            self.total_conflicts + delta >= restart_best:
+                        continue  # tabu, and no aspiration
+                    if best_delta is None or delta < best_delta:
+                        best_delta, moves = delta, [(s1, s2)]
+                    elif delta == best_delta:
+                        moves.append((s1, s2))
+            if moves:
+                s1, s2 = random.choice(moves)
+            else:  # every swap of these squares is tabu: random swap
+                s1 = random.choice(list(partners))
+                s2 = random.choice(partners[s1])
+                best_delta = None
+            tabu[s1, self.gv_current[s1]] = tabu[s2, self.gv_current[s2]] = self.iterations + tabu_tenure
+            self.swap(s1, s2, best_delta)
+
+            if self.total_conflicts < restart_best:
+                restart_best, last_improvement = self.total_conflicts, self.iterations
+                if restart_best < best_conflicts:
+                    best_grid, best_conflicts = self.gv_current.copy(), restart_best
+                    if best_conflicts == 0:  # solution found
+                        break
+            elif self.iterations - last_improvement >= restart_after:  # stagnation: random restart
+                self.restarts += 1
+                self.fill_grid_randomly()
+                self.init_conflict_counts()
+                tabu.clear()
+                restart_best, last_improvement = self.total_conflicts, self.iterations
+                if verbose:
+                    print(f'Restart after {self.iterations} swaps ({self.restarts} restarts), '
+                          f'best total conflicts is {best_conflicts}')
+        else:
+            self.exceeded = 'nodes'  # max_iterations
+        if budget is not None and budget.reason:
+            self.exceeded = budget.reason
+        if best_conflicts == 0:
+            self.exceeded = None
+
+        if verbose:
+            print(f'FINAL SOLUTION: found {best_conflicts} conflicts after {self.iterations} swaps '
+                  f'and {self.restarts} restarts.')
+        self.gv_current = best_grid
+        self.init_conflict_counts()  # counts of the best grid
+        return self.gv_current
+
+
 # Utilities
 def some(seq):
     """Return some element of seq that is true."""
@@ -360,25 +629,41 @@ def shuffled(seq):
 # System test
 
 
-def solve_all(grids, name='', showif=0.0, search_method='Hill Climbing'):
-    """Attempt to solve a sequence of grids. Report results.
-    When showif is a number of seconds, display puzzles that take longer.
-    When showif is None, don't display any puzzles."""
+def time_solve(grid, search_method, options, box=3, max_nodes=None, max_seconds=None):
+    """Solve grid and return (CPU seconds, solved, gv_current, exceeded), within a Budget of max_nodes
+    iterations and max_seconds of wall clock when they are not None (exceeded is then the reason it ran
+    out, or None). Module-level so that solve_all can run it in worker processes."""
+    budget = Budget(max_nodes, max_seconds) if max_nodes is not None or max_seconds is not None else None
+    start = time.process_time()
+    sudoku = Sudoku(grid, box=box)
+    gv_init, gv_current = sudoku.solve(search_method, budget=budget, **options)
+    return time.process_time() - start, sudoku.is_solved(), gv_current, sudoku.exceeded
 
-    def time_solve(grid):
-        start = time.process_time()
-        sudoku = Sudoku(grid)
-        gv_init, gv_current = sudoku.solve(search_method)
-        t = time.process_time() - start
 
+def solve_all(grids, name='', showif=0.0, search_method='Hill Climbing', workers=1, box=3, max_nodes=None,
+              max_seconds=None, **options):
+    """Attempt to solve a sequence of grids (of box*box x box*box boards, 9x9 by default). Report results.
+    When showif is a number of seconds, display puzzles that take longer.
+    When showif is None, don't display any puzzles.
+    When workers is not 1, the grids are solved in a pool of workers processes (None for one per CPU).
+    max_nodes (iterations) and max_seconds bound the search of each puzzle (see sudoku_stats.Budget): the
+    puzzles that run out of budget are counted apart from the ones left at a local optimum.
+    options are passed to Sudoku.solve (search parameters such as max_iterations)."""
+    grids = list(grids)
+    timed, wall = parallel.run(
+        functools.partial(time_solve, search_method=search_method, options=options, box=box, max_nodes=max_nodes,
+                          max_seconds=max_seconds), grids, workers
+    )
+    for grid, (t, is_solved, gv_current, exceeded) in zip(grids, timed):
         # Display puzzles that take long enough
         if showif is not None and t > showif:
+            sudoku = Sudoku(grid, box=box)
+            sudoku.gv_current = gv_current
             sudoku.display_gv()
             print('(%.2f seconds)\n' % t)
-
-        return t, sudoku.is_solved()
-
-    times, results = zip(*[time_solve(grid) for grid in grids])
+    times = [t for t, is_solved, gv_current, exceeded in timed]
+    results = [is_solved for t, is_solved, gv_current, exceeded in timed]
+    over_budget = sum(exceeded is not None for t, is_solved, gv_current, exceeded in timed)
     len_grids = len(grids)
 
     # Will avoid division by zero if time is too short (0.0).
@@ -390,6 +675,16 @@ def solve_all(grids, name='', showif=0.0, search_method='Hill Climbing'):
     if len_grids >= 1:
         print("Solved %d of %d %s puzzles in %.2f secs (avg %.2f secs (%d Hz), max %.2f secs). - %s" % (
             sum(results), len_grids, name, sum(times), sum(times) / len_grids, hz, max(times), search_method))
+        # Time to solution distribution (solved puzzles only)
+        solved_times = sorted(t for t, result in zip(times, results) if result)
+        if solved_times:
+            print("    solve rate %.1f%% - time to solution p50 %.3f secs, p90 %.3f secs, p99 %.3f secs, max %.3f secs" % (
+                100 * len(solved_times) / len_grids, percentile(solved_times, 50), percentile(solved_times, 90),
+                percentile(solved_times, 99), solved_times[-1]))
+        if over_budget or max_nodes is not None or max_seconds is not None:
+            print("    budget exceeded %d - stuck %d (budget: %s iterations, %s secs)" % (
+                over_budget, len_grids - sum(results) - over_budget, max_nodes, max_seconds))
+        parallel.report(len_grids, wall, sum(times), workers)
 
 
 if __name__ == '__main__':
@@ -401,6 +696,8 @@ if __name__ == '__main__':
     solve_all(from_file("MesSudokus/easy50.txt"), "easy50 ", 9.0, 'Hill Climbing')
     solve_all(from_file("MesSudokus/top95.txt"),      "top95  ", 9.0, 'Hill Climbing')
     solve_all(from_file("MesSudokus/hardest.txt"),    "hardest", 9.0, 'Hill Climbing')
+    # solve_all(from_file("MesSudokus/top95.txt"), "top95  ", 9.0, 'Simulated Annealing', max_seconds=10.0)
+    # solve_all(from_file("MesSudokus/easy50.txt"), "easy50 ", 9.0, 'Tabu Search', max_seconds=5.0)
     solve_all(from_file("MesSudokus/100sudoku.txt"),  "100puz ", 9.0, 'Hill Climbing')
     #solve_all(from_file("MesSudokus/1000sudoku.txt"), "1000puz", 9.0, 'Hill Climbing')
 
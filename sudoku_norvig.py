@@ -11,31 +11,26 @@
 ##   grid is a grid,e.g. 81 non-blank chars, e.g. starting with '.18...7...
 ##   values is a dict of possible values, e.g. {'A1':'12349', 'A2':'8', ...}
 
+import functools
 import re  # DG Will be used for substring removal
 import time, random
 
+import sudoku_dlx
+import sudoku_parallel as parallel
+import sudoku_stats
+from sudoku_stats import Budget, SolveStats, exceeded
 
-def cross(A, B):
-    "Cross product of elements in A and elements in B."
-    return [a + b for a in A for b in B]
+from sudoku_topology import cross, digits, rows, cols
+import sudoku_topology as topology
 
+## The tables are precomputed once in sudoku_topology, with square names as keys
+squares = list(topology.squares)
+unitlist = topology.named_unitlist
+units = topology.named_units
+peers = topology.named_peers
 
-digits = '123456789'
-rows = 'ABCDEFGHI'
-cols = digits
-squares = cross(rows, cols)
-unitlist = ([cross(rows, c) for c in cols] +
-            [cross(r, cols) for r in rows] +
-            [cross(rs, cs) for rs in ('ABC', 'DEF', 'GHI') for cs in ('123', '456', '789')])
-units = dict((s, [u for u in unitlist if s in u])
-             for s in squares)
-peers = dict((s, set(sum(units[s], [])) - set([s]))
-             for s in squares)
-
-search_methods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved', 'Hill'}  # DGNEW the available search methods
-global counttotalsearches, countnakedimprovements  # DGTEMP The total number of searches and the maximum depth (not sure if implemented correctly)
-counttotalsearches = 0
-countnakedimprovements = 0  # Number of naked pairs or triples found
+search_methods = {'Brute Force', 'Norvig Heuristic', 'Norvig Improved', 'Hill', 'Portfolio', 'DLX'}  # DGNEW the available search methods
+portfolio_methods = ('Norvig Heuristic', 'Norvig Heuristic', 'Norvig Improved', 'Brute Force')  # raced by 'Portfolio'
 
 
 ################ Unit Tests ################
@@ -46,27 +41,37 @@ def test():
     assert len(unitlist) == 27
     assert all(len(units[s]) == 3 for s in squares)
     assert all(len(peers[s]) == 20 for s in squares)
-    assert units['C2'] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
-                           ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
-                           ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
+    assert [list(u) for u in units['C2']] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
+                                              ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
+                                              ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
     assert peers['C2'] == {'A2', 'B2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2', 'C1', 'C3',
                            'C4', 'C5', 'C6', 'C7', 'C8', 'C9', 'A1', 'A3', 'B1', 'B3'}
+    stats = SolveStats()
+    assert solve(hard1, 'Brute Force', stats=stats, budget=Budget(max_nodes=5)) is exceeded
+    assert stats.exceeded == 'nodes' and stats.nodes == 5
+    assert solve(hard1, 'DLX', budget=Budget(max_nodes=5)) is exceeded
+    assert solve('123', 'Portfolio') is False  ## Every racer raises on the invalid grid: no hang
+    assert solve(hard1, 'Portfolio', budget=Budget(max_nodes=3)) is exceeded  ## Each racer has 3 nodes
+    assert solved(solve(hard1, 'Portfolio', budget=Budget(max_nodes=10 ** 6)))
+    assert solved(solve(hard1, 'Norvig Heuristic', budget=Budget(max_nodes=10 ** 6, max_seconds=10.0)))
+    ## Results come back pickled from the worker processes: exceeded must stay exceeded (not stored as unsolvable)
+    import sudoku_store
+    with sudoku_store.SolutionStore(':memory:') as store:
+        solve_all([grid1, hard1, hard1], 'budget', None, 'Brute Force', workers=2, store=store, max_nodes=5)
+        assert store.get(grid1) and store.get(hard1) is None
     print('All tests pass.')
 
 
 ################ Parse a Grid ################
 
-def parse_grid(grid):
+def parse_grid(grid, stats=None):
     """Convert grid to a dict of possible values, {square: digits}, or
     return False if a contradiction is detected."""
     ## To start, every square can be any digit; then assign values from the grid.
     values = dict((s, digits) for s in squares)
-    print(f"Parse grid START: {values}") #DG REMOVE
     for s, d in grid_values(grid).items():
-        if d in digits and not assign(values, s, d):
+        if d in digits and not assign(values, s, d, stats=stats):
             return False  ## (Fail if we can't assign d to square s.)
-
-    print(f"Parse grid DONE: {values}")  # DG REMOVE
     return values
 
 
@@ -79,34 +84,36 @@ def grid_values(grid):
 
 ################ Constraint Propagation ################
 
-def assign(values, s, d):
+def assign(values, s, d, trail=None, stats=None):
     """Eliminate all the other values (except d) from values[s] and propagate.
-    Return values, except return False if a contradiction is detected."""
-    global counttotalsearches  # DGTEMP
-    counttotalsearches += 1  # DGTEMP
-
+    Return values, except return False if a contradiction is detected.
+    With a trail (list), each change appends s and the previous values[s] to it, so that it can be undone.
+    With stats (a SolveStats), the assignments and eliminations are counted."""
+    if stats is not None:
+        stats.assignments += 1
     other_values = values[s].replace(d, '')
-    if all(eliminate(values, s, d2) for d2 in other_values):
+    if all(eliminate(values, s, d2, trail, stats) for d2 in other_values):
         return values
     else:
         return False
 
 
-def eliminate(values, s, d):
+def eliminate(values, s, d, trail=None, stats=None):
     """Eliminate d from values[s]; propagate when values or places <= 2.
     Return values, except return False if a contradiction is detected."""
-    global counttotalsearches  # DGTEMP
-    counttotalsearches += 1  # DGTEMP
-
     if d not in values[s]:
         return values  ## Already eliminated
+    if stats is not None:
+        stats.eliminations += 1
+    if trail is not None:
+        trail += s, values[s]
     values[s] = values[s].replace(d, '')
     ## (1) If a square s is reduced to one value d2, then eliminate d2 from the peers.
     if len(values[s]) == 0:
         return False  ## Contradiction: removed last value
     elif len(values[s]) == 1:
         d2 = values[s]
-        if not all(eliminate(values, s2, d2) for s2 in peers[s]):
+        if not all(eliminate(values, s2, d2, trail, stats) for s2 in peers[s]):
             return False
     ## (2) If a unit u is reduced to only one place for a value d, then put it there.
     for u in units[s]:
@@ -115,7 +122,7 @@ def eliminate(values, s, d):
             return False  ## Contradiction: no place for this value
         elif len(dplaces) == 1:
             # d can only be in one place in unit; assign it there
-            if not assign(values, dplaces[0], d):
+            if not assign(values, dplaces[0], d, trail, stats):
                 return False
     return values
 
@@ -134,16 +141,60 @@ def display(values):
 
 ################ Search ################
 
-def solve(grid, search_method):
-    return search(parse_grid(grid), search_method)
+def solve(grid, search_method, cache=None, stats=None, budget=None):
+    """Solve grid with search_method. When cache is a sudoku_cache.SolutionCache, a puzzle equivalent
+    (under the Sudoku symmetries) to one already solved is answered from the cache.
+    When stats is a sudoku_stats.SolveStats, the work done is added to it.
+    When budget is a sudoku_stats.Budget, the search stops when it is exhausted and returns exceeded."""
+    if cache is not None:
+        return cache.solve(grid, functools.partial(solve, search_method=search_method, stats=stats, budget=budget))
+    if search_method == 'Portfolio':  # The work is done (and counted) in the racing processes
+        return solve_portfolio(grid, budget=budget)
+    if stats is None:
+        stats = SolveStats()
+    start = time.process_time()
+    if search_method == 'DLX':  # Exact cover with dancing links, no propagation on values
+        values, nodes = sudoku_dlx.search(grid, budget)
+        stats.nodes += nodes
+        stats.times['search'] += time.process_time() - start
+        if values is exceeded:
+            stats.exceeded = budget.reason
+        return values
+    values = parse_grid(grid, stats)
+    parsed = time.process_time()
+    stats.times['parse'] += parsed - start
+    values = search(values, search_method, stats, budget)
+    stats.times['search'] += time.process_time() - parsed
+    return values
+
+
+def solve_portfolio(grid, methods=portfolio_methods, timeout=None, budget=None):
+    """Race the search methods in separate processes on the same grid and return the values of the
+    first racer that completes its search: a solution, or False when there is none (every method is
+    complete). Each process has its own random seed, so listing a method several times races several
+    seeds of its randomized search (run times are heavy-tailed).
+    The deadline of a budget is the timeout of the race, and its max_nodes bounds each racer (with a
+    Budget of its own): exceeded is returned when the deadline passes or every racer runs out of nodes."""
+    max_nodes = None if budget is None else budget.max_nodes
+    if budget is not None and budget.deadline is not None:
+        timeout = budget.remaining()
+    racers = [functools.partial(solve, grid, method, budget=None if max_nodes is None else Budget(max_nodes))
+              for method in methods]
+    k, values = parallel.race(racers, lambda values: values is not exceeded, timeout)
+    if k is None and budget is not None:
+        if budget.deadline is not None and budget.remaining() == 0:
+            budget.reason = 'deadline'
+            return exceeded
+        if max_nodes is not None:
+            budget.reason = 'nodes'
+            return exceeded
+    return values
 
 
-def findbettersquarewithpairsandtriplesOLD(s, values, printwhenfound=True):  # DGNEW    <--------------- THIS CODE CAN BE OPTIMIZED
+def findbettersquarewithpairsandtriplesOLD(s, values, printwhenfound=True, stats=None):  # DGNEW    <--------------- THIS CODE CAN BE OPTIMIZED
     """Will use naked pairs in order to identify a better square to use if possible.
        Inspired by https://www.sudokuoftheday.com/techniques/naked-pairs-triples/"""
 
-    global countnakedimprovements  # Ensures the use of the global variable
-
     # Reminder: assert units['C2'] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
     # ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
     # ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
@@ -160,7 +211,7 @@ def findbettersquarewithpairsandtriplesOLD(s, values, printwhenfound=True):  # D
                 #    print(f"Naked pair ''{values[s]}'' found for squares {s} and {square_in_same_unit}")
 
                 # Since a naked pair is found, we can remove the two digits from this pair in all other squares in this unit to see if we solve a square
-                listofsquarestoreview = unit.copy()
+                listofsquarestoreview = list(unit)
                 listofsquarestoreview.remove(s)
                 listofsquarestoreview.remove(square_in_same_unit)
                 for s2 in listofsquarestoreview:
@@ -171,7 +222,8 @@ def findbettersquarewithpairsandtriplesOLD(s, values, printwhenfound=True):  # D
                     # print(f"Found square {s2} with value {newvalue} because of naked pair ''{values[s]}'' found for squares {s} and {square_in_same_unit}")
                     if (numberofvaluesfinal < numberofvaluesinitial) and (
                             numberofvaluesfinal == 1):  # DG we solved a square because of the naked pair, which makes it a better candidate
-                        countnakedimprovements += 1  # Number of naked pairs or triples found
+                        if stats is not None:
+                            stats.naked_pairs += 1  # Number of naked pairs or triples found
                         if printwhenfound:
                             print(
                                 f"Solved square {s2} with possible digits {possibledigits} because of naked pair ''{values[s]}'' found for squares {s} and {square_in_same_unit}")
@@ -182,11 +234,10 @@ def findbettersquarewithpairsandtriplesOLD(s, values, printwhenfound=True):  # D
     return None, None  # No better square found
 
 
-def findbettersquarewithpairsandtriples(values_in, printwhenfound=True):  # DGNEW    <--------------- THIS CODE CAN BE OPTIMIZED
+def findbettersquarewithpairsandtriples(values_in, printwhenfound=True, stats=None):  # DGNEW    <--------------- THIS CODE CAN BE OPTIMIZED
     """Will use naked pairs in order to identify a better square to use if possible.
-       Inspired by https://www.sudokuoftheday.com/techniques/naked-pairs-triples/"""
-
-    global countnakedimprovements  # Ensures the use of the global variable
+       Inspired by https://www.sudokuoftheday.com/techniques/naked-pairs-triples/
+       The naked pairs found are counted in stats (a SolveStats), if any."""
 
     # Reminder: assert units['C2'] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
     # ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
@@ -207,7 +258,7 @@ def findbettersquarewithpairsandtriples(values_in, printwhenfound=True):  # DGNE
                     #    print(f"Naked pair ''{values[s]}'' found for squares {s} and {square_in_same_unit}")
 
                     # Since a naked pair is found, we can remove the two digits from this pair in all other squares in this unit to see if we solve a square
-                    listofsquarestoreview = unit.copy()
+                    listofsquarestoreview = list(unit)
                     listofsquarestoreview.remove(s)
                     listofsquarestoreview.remove(square_in_same_unit)
                     for s2 in listofsquarestoreview:
@@ -218,7 +269,8 @@ def findbettersquarewithpairsandtriples(values_in, printwhenfound=True):  # DGNE
                         # print(f"Found square {s2} with value {newvalue} because of naked pair ''{values[s]}'' found for squares {s} and {square_in_same_unit}")
                         if (numberofvaluesfinal < numberofvaluesinitial) and (
                                 numberofvaluesfinal == 1):  # DG we solved a square because of the naked pair, which makes it a better candidate
-                            countnakedimprovements += 1  # Number of naked pairs or triples found
+                            if stats is not None:
+                                stats.naked_pairs += 1  # Number of naked pairs or triples found
                             if printwhenfound:
                                 print(
                                     f"Solved square {s2} with possible digits {possibledigits} because of naked pair ''{values_in[s]}'' found for squares {s} and {square_in_same_unit}")
@@ -229,59 +281,70 @@ def findbettersquarewithpairsandtriples(values_in, printwhenfound=True):  # DGNE
     return None, None  # No better square found
 
 
-def search(values, search_method):
-    """Using depth-first search and propagation, try all possible values."""
+def search(values, search_method, stats=None, budget=None):
+    """Using depth-first search and propagation, try all possible values.
+    The search works on values in place (returned when solved): each node records its changes on
+    an undo trail, popped on backtrack, and the nodes are kept on an explicit stack, not recursion.
+    The work done is counted in stats (a SolveStats), if any. When budget (a sudoku_stats.Budget)
+    is exhausted, the search stops and returns exceeded (values is then partly filled)."""
     if values is False:
         return False  ## Failed earlier
-    if all(len(values[s]) == 1 for s in squares):
-        return values  ## Solved!
-
-    global counttotalsearches  # DGTEMP
-    counttotalsearches += 1  ##DGTEMPIncreases to number of total searches
-
-    # DG NEW CODE START ---------------------------------------------------
     # Will search differently depending on the search method
     if search_method not in search_methods: raise ValueError(
         f"Unknown search method {search_method}. Available search methods are {search_methods}")  # DGNEW
 
+    if stats is None:
+        stats = SolveStats()
+    trail = []  # square, previous values, ... of every change since the root
+    stack = []  # (trail length at the node, iterator over the (square, digit) left to try) of each node
+    while True:
+        unfilled = [s for s in squares if len(values[s]) > 1]
+        if not unfilled:
+            return values  ## Solved!
+        if budget is not None and budget.spend():
+            stats.exceeded = budget.reason
+            return exceeded  ## Out of budget
+        stats.nodes += 1
+        stack.append((len(trail), iter(branches(values, unfilled, search_method, stats))))
+        stats.max_depth = max(stats.max_depth, len(stack))
+        while stack:
+            mark, choices = stack[-1]
+            while len(trail) > mark:  # undo the previous branch of this node
+                previous = trail.pop()
+                values[trail.pop()] = previous
+            choice = next(choices, None)
+            if choice is None:
+                stack.pop()  ## No branch left: backtrack
+                stats.backtracks += 1
+            elif assign(values, choice[0], choice[1], trail, stats):
+                break  ## Go down this branch
+            else:
+                stats.backtracks += 1
+        else:
+            return False  ## Every branch failed
+
+
+def branches(values, unfilled, search_method, stats=None):
+    """Return the (square, digit) assignments to try at a search node (unfilled: its unfilled squares), in order."""
+    # DG NEW CODE START ---------------------------------------------------
     if search_method == 'Brute Force':
         # choose a random unfilled square
-        s = random.choice([s_tmp for s_tmp in squares if len(values[s_tmp]) > 1])
+        s = random.choice(unfilled)
     elif search_method == 'Norvig Heuristic':
         # Chose the unfilled square s with the fewest possibilities
-        n, s = min((len(values[s]), s) for s in squares if len(values[s]) > 1)  # n is the number of possible values for this square
+        n, s = min((len(values[s]), s) for s in unfilled)  # n is the number of possible values for this square
     elif search_method == 'Norvig Improved':
-        s2, possible_digits = findbettersquarewithpairsandtriples(values, False)  # DGHERE Will identify Naked Pairs/Triples in order to select a better value
-        if s2:  # If a better square is found (s2), will use it
-            values_new = values.copy()
-            values_new[s2] = possible_digits
-            # print(f"Better square found: {s2} with possibledigits={valuesnew[s2]}") # DGTEMP
-            return search(assign(values_new, s2, possible_digits), search_method)  # DGREVIEW We assign the value to s2 for Naked pair. But values aren't updated permanently
-            # return some(search(assign(valuesnew, s2, d), search_method)
-            #            for d in possibledigits) #DG uses values2, which is a result with less options than values for square s2
-
+        s2, possible_digits = findbettersquarewithpairsandtriples(values, False, stats)  # DGHERE Will identify Naked Pairs/Triples in order to select a better value
+        if s2:  # If a better square is found (s2), the naked pair leaves a single branch
+            return [(s2, possible_digits)]
         # DG if no better square found, will take the Norvig Heuristic
-        n, s = min((len(values[s]), s) for s in squares if len(values[s]) > 1)  # n is the number of possible values for this square
-
-        # s2, possibledigits = findbettersquarewithpairsandtriples(values, False) #DGHERE Will identify Naked Pairs/Triples in order to select a better value
-        # if s2: # If a better square is found (s2), will use it
-        #     #d2 = some(d for d in values2) #DGTEMP
-        #     #print(f"Better square found: {s2} with possibledigits={possibledigits} and d2={d2}") # DGTEMP
-        #     valuesnew = values.copy() #DGSCRAP
-        #     valuesnew[s2] = possibledigits
-        #     #print(f"Better square found: {s2} with possibledigits={valuesnew[s2]}") # DGTEMP
-        #     return some(search(assign(valuesnew.copy(), s2, d), search_method)
-        #                 for d in possibledigits) #DG uses values2, which is a result with less options than values for square s2
-
-    elif search_method == 'Hill':
-        pass
-
+        n, s = min((len(values[s]), s) for s in unfilled)  # n is the number of possible values for this square
     else:
-        raise ValueError(f"Search method {search_method} not implemented")
+        raise ValueError(f"Search method {search_method} not implemented")  # 'Hill': see sudoku_hill_class
     # DGNEW CODE STOP ---------------------------------------------------
 
     # try possible numbers for s in random order
-    return some(search(assign(values.copy(), s, d), search_method) for d in shuffled(values[s]))  # DG for d in values[s]) if we want to get rid of the random aspect of shuffled and always follow the same path
+    return [(s, d) for d in shuffled(values[s])]  # DG for d in values[s]) if we want to get rid of the random aspect of shuffled and always follow the same path
 
 
 ################ Utilities ################
@@ -323,37 +386,64 @@ def filterTheDict(dictObj, callback):  # DGTEMP - Not useful anymore
 ################ System test ################
 
 
-def solve_all(grids, name='', showif=0.0, search_method='ToSpecify'):
-    """Attempt to solve a sequence of grids. Report results.
-    When showif is a number of seconds, display puzzles that take longer.
-    When showif is None, don't display any puzzles."""
-    global counttotalsearches, countnakedimprovements  # DGTEMP
-    counttotalsearches = 0  # DGTEMP the total of searches
-    countnakedimprovements = 0  # DGTEMP the total of searches
+def time_solve(grid, search_method, cache=None, max_nodes=None, max_seconds=None):
+    """Solve grid and return (CPU seconds, values, SolveStats), within a Budget of max_nodes search nodes
+    and max_seconds of wall clock when they are not None. Module-level so that solve_all can run it in
+    worker processes."""
+    stats = SolveStats()
+    budget = Budget(max_nodes, max_seconds) if max_nodes is not None or max_seconds is not None else None
+    start = time.process_time()
+    values = solve(grid, search_method, cache, stats, budget)
+    return time.process_time() - start, values, stats
 
-    def time_solve(grid):
-        # start = time.clock()
-        start = time.process_time()
-        values = solve(grid, search_method)
-        t = time.process_time() - start
 
-        # display(grid_values(grid)) #DGREMOVED
-        # if values: display(values) #DGREMOVED
+def solve_all(grids, name='', showif=0.0, search_method='ToSpecify', workers=1, cache=None, store=None,
+              profiler=None, max_nodes=None, max_seconds=None):
+    """Attempt to solve a sequence of grids. Report results.
+    When showif is a number of seconds, display puzzles that take longer.
+    When showif is None, don't display any puzzles.
+    When workers is not 1, the grids are solved in a pool of workers processes
+    (None for one per CPU).
+    The solution cache, if any, is only used when workers is 1 (it lives in this process).
+    When store is a sudoku_store.SolutionStore, the grids found in it are not solved again (they
+    count 0 secs) and the new solutions are added to it in bulk.
+    When profiler is a sudoku_profile.Profiler, every puzzle is profiled (in this process, so workers
+    is ignored) and the profiles of the slow ones are written out at the end.
+    max_nodes and max_seconds bound the search of each puzzle (see sudoku_stats.Budget): the puzzles
+    that run out of budget are counted apart from the ones without solution."""
+    if search_method not in search_methods:
+        raise ValueError(
+            f"Unknown search method {search_method}. Available search methods are {search_methods}"
+        )  # DGNEW
 
+    grids = list(grids)
+    if profiler is not None:
+        workers = 1
+    worker = functools.partial(time_solve, search_method=search_method, cache=cache if workers == 1 else None,
+                               max_nodes=max_nodes, max_seconds=max_seconds)
+    if profiler is not None:
+        worker = profiler.wrap(worker)
+    if store is not None:
+        known = store.get_many(grids)
+        todo = [grid for grid in grids if grid not in known]
+        timed_todo, wall = parallel.run(worker, todo, workers)
+        store.put_many((grid, values, search_method, t, stats) for grid, (t, values, stats) in zip(todo, timed_todo)
+                       if values is not exceeded)
+        timed_todo = dict(zip(todo, timed_todo))
+        timed = [(0.0, known[grid], SolveStats()) if grid in known else timed_todo[grid] for grid in grids]
+    else:
+        timed, wall = parallel.run(worker, grids, workers)
+    times, results = [], []
+    all_stats = [stats for t, values, stats in timed]
+    for grid, (t, values, stats) in zip(grids, timed):
         ## Display puzzles that take long enough
         if showif is not None and t > showif:
             display(grid_values(grid))
             if values:
                 display(values)
             print('(%.2f seconds)\n' % t)
-        return t, solved(values)
-
-    if search_method not in search_methods:
-        raise ValueError(
-            f"Unknown search method {search_method}. Available search methods are {search_methods}"
-        )  # DGNEW
-
-    times, results = zip(*[time_solve(grid) for grid in grids])
+        times.append(t)
+        results.append(solved(values))
     N = len(grids)
 
     # DG Will avoid division by zero if time is too short (0.0).
@@ -366,11 +456,25 @@ def solve_all(grids, name='', showif=0.0, search_method='ToSpecify'):
         #        print ("Solved %d of %d %s puzzles (avg %.2f secs (%d Hz), max %.2f secs)." % (
         #            sum(results), N, name, sum(times)/N, N/sum(times), max(times))) #DG REMOVED
         print(
-            "Solved %d of %d %s puzzles in %.2f secs (avg %.2f secs (%d Hz), max %.2f secs). Total searches %d - Naked improvements %d - %s" % (
-                sum(results), N, name, sum(times), sum(times) / N, hz, max(times), counttotalsearches,
-                countnakedimprovements, search_method
+            "Solved %d of %d %s puzzles in %.2f secs (avg %.2f secs (%d Hz), max %.2f secs). Search nodes %d - Naked improvements %d - %s" % (
+                sum(results), N, name, sum(times), sum(times) / N, hz, max(times),
+                sum(stats.nodes for stats in all_stats), sum(stats.naked_pairs for stats in all_stats), search_method
             )
         )  # DGNEW Added parameter for search method
+        over_budget = sum(values is exceeded for t, values, stats in timed)
+        if max_nodes is not None or max_seconds is not None:
+            print("    budget exceeded %d - no solution %d (budget: %s nodes, %s secs)" % (
+                over_budget, N - sum(results) - over_budget, max_nodes, max_seconds))
+        parallel.report(N, wall, sum(times), workers)
+        sudoku_stats.report(all_stats)
+        if cache is not None and workers == 1:
+            print("    cache %s" % cache.stats())
+        if store is not None:
+            print("    store %s" % store.stats())
+        if profiler is not None:
+            paths = profiler.write()
+            print("    profiles of %d slow puzzle(s) written to %s (%d files)" % (
+                len(profiler.kept()), profiler.directory, len(paths)))
 
 
 def solved(values):
@@ -378,21 +482,21 @@ def solved(values):
 
     def unitsolved(unit): return set(values[s] for s in unit) == set(digits)
 
-    return values is not False and all(unitsolved(unit) for unit in unitlist)
+    return bool(values) and all(unitsolved(unit) for unit in unitlist)
 
 
 def random_puzzle(N=17):
     """Make a random puzzle with N or more assignments. Restart on contradictions.
     Note the resulting puzzle is not guaranteed to be solvable, but empirically
     about 99.8% of them are solvable. Some have multiple solutions."""
-    values = dict((s, digits) for s in squares)
-    for s in shuffled(squares):
-        if not assign(values, s, random.choice(values[s])):
-            break
-        ds = [values[s] for s in squares if len(values[s]) == 1]
-        if len(ds) >= N and len(set(ds)) >= 8:
-            return ''.join(values[s] if len(values[s]) == 1 else '.' for s in squares)
-    return random_puzzle(N)  ## Give up and make a new puzzle
+    while True:
+        values = dict((s, digits) for s in squares)
+        for s in shuffled(squares):
+            if not assign(values, s, random.choice(values[s])):
+                break  ## Give up and make a new puzzle
+            ds = [values[s] for s in squares if len(values[s]) == 1]
+            if len(ds) >= N and len(set(ds)) >= 8:
+                return ''.join(values[s] if len(values[s]) == 1 else '.' for s in squares)
 
 
 grid1 = '003020600900305001001806400008102900700000008006708200002609500800203009005010300'
@@ -420,6 +524,8 @@ if __name__ == '__main__':
     # solve_all(from_file("MesSudokus/hardest.txt"), "hardest", 1.0, 'Brute Force')
     # solve_all(from_file("MesSudokus/hardest.txt"), "hardest", 1.0, 'Norvig Heuristic')
     # solve_all(from_file("MesSudokus/hardest.txt"), "hardest", 1.0, 'Norvig Improved')
+    # solve_all(from_file("MesSudokus/hardest.txt"), "hardest", 1.0, 'Portfolio')
+    # solve_all(from_file("MesSudokus/hardest.txt"), "hardest", 1.0, 'DLX')
     # print('-----------')
     # solve_all(from_file("MesSudokus/100sudoku.txt"), "100puz ", 1.0, 'Brute Force')
     # solve_all(from_file("MesSudokus/100sudoku.txt"), "100puz ", 1.0, 'Norvig Heuristic')
@@ -428,6 +534,7 @@ if __name__ == '__main__':
     # solve_all(from_file("MesSudokus/1000sudoku.txt"), "1000puz", 1.0, 'Brute Force')
     # solve_all(from_file("MesSudokus/1000sudoku.txt"), "1000puz", 1.0, 'Norvig Heuristic')
     # solve_all(from_file("MesSudokus/1000sudoku.txt"), "1000puz", 1.0, 'Norvig Improved')
+    # solve_all(from_file("MesSudokus/1000sudoku.txt"), "1000puz", 1.0, 'Norvig Heuristic', workers=None)  # 1 process per CPU
     # print('-----------')
     # solve_all(from_file("MesSudokus/1puzzle.txt"), "1puzzle", 1.0, 'Brute Force')
     # solve_all(from_file("MesSudokus/1puzzle.txt"), "1puzzle", 1.0, 'Norvig Heuristic')
@@ -0,0 +1,117 @@
+## Parallel batch solving shared by the solve_all functions
+
+## The puzzles are independent, so solve_all can spread them over a
+## concurrent.futures process pool. The worker must be a module-level function
+## (or a functools.partial of one) so that it can be pickled.
+## race() runs several solvers on the same puzzle and keeps the first solution.
+
+import functools
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
+
+race_poll = 0.05  # seconds between two checks of the racing processes that died without reporting
+
+
+def default_workers():
+    """Number of worker processes used when workers is None: one per CPU."""
+    return os.cpu_count() or 1
+
+
+def run(worker, items, workers=1, chunksize=None):
+    """Apply worker to every item and return (results in input order, wall-clock seconds).
+    When workers is 1 the items are processed in this process; otherwise they are
+    dispatched in chunks to a pool of workers processes (None for one per CPU).
+    By default the chunks are sized so that each worker gets about 4 of them."""
+    items = list(items)
+    start = time.perf_counter()
+    if workers is None:
+        workers = default_workers()
+    if workers == 1 or len(items) <= 1:
+        results = [worker(item) for item in items]
+    else:
+        workers = min(workers, len(items))
+        if chunksize is None:
+            chunksize = max(1, len(items) // (4 * workers))
+        # Each worker reseeds random, otherwise forked workers would all share the parent's random state
+        with ProcessPoolExecutor(max_workers=workers, initializer=random.seed) as pool:
+            results = list(pool.map(worker, items, chunksize=chunksize))
+    return results, time.perf_counter() - start
+
+
+def report(n, wall, cpu, workers=1):
+    """Print the wall-clock throughput next to the CPU time of a batch of n puzzles."""
+    if workers is None:
+        workers = default_workers()
+    print("    wall clock %.2f secs (%d Hz) with %d worker(s) - CPU %.2f secs (%.1fx)" % (
+        wall, n / wall if wall else 999, workers, cpu, cpu / wall if wall else 0.0))
+
+
+################ Portfolio racing ################
+
+def race_entry(queue, k, task):
+    """Run task in a racing process and report (k, result) to the parent, (k, False) if task raises
+    (the parent waits for one report per process)."""
+    random.seed()  # forked processes would otherwise share the parent's random state
+    try:
+        result = task()
+    except Exception:
+        result = False
+    queue.put((k, result))
+
+
+def race(tasks, verify=bool, timeout=None):
+    """Run every task (a picklable callable without arguments) in its own process, on the same puzzle.
+    Return (k, result) for the first task k whose result is accepted by verify and terminate the
+    other processes. Return (None, False) if no task gives a verified result within timeout seconds.
+    A process that dies without reporting (killed, out of memory, result that can't be pickled...)
+    counts as a task with a False result."""
+    ctx = multiprocessing.get_context()
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=race_entry, args=(queue, k, task), daemon=True)
+                 for k, task in enumerate(tasks)]
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    try:
+        for p in processes:
+            p.start()
+        pending = set(range(len(processes)))  # tasks not reported yet
+        while pending:
+            ## The processes dead before the wait have put their report, if any, in the queue already
+            dead = [k for k in pending if processes[k].exitcode is not None]
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                break  # timeout
+            try:
+                k, result = queue.get(timeout=race_poll if remaining is None else min(race_poll, remaining))
+            except Empty:
+                pending.difference_update(dead)  # died without a report
+                continue
+            pending.discard(k)
+            if verify(result):
+                return k, result
+        return None, False
+    finally:
+        for p in processes:  # cancel the rest of the race
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        queue.close()
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    assert run(abs, [-1, -2, 3, -4], 2)[0] == [1, 2, 3, 4]
+    ## A racer that dies without reporting counts as a failed one, instead of hanging the race
+    assert race([functools.partial(os._exit, 1)]) == (None, False)
+    assert race([functools.partial(os._exit, 1), functools.partial(int, '7')]) == (1, 7)
+    assert race([functools.partial(time.sleep, 10)], timeout=0.1) == (None, False)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,250 @@
+## Tiered solving: the cheapest tier that resolves a puzzle is the last one it goes through
+
+## Tier 0 (propagation): naked and hidden singles, with the bitmask engine of sudoku_bits;
+##   many easy puzzles are solved right there. Instead of assigning the clues one by one
+##   (sudoku_bits.parse_grid), the candidates of every square are set at once from the
+##   digits already used in its units, so only the consequences go through eliminate.
+## Tier 1 (pairs): naked pairs and hidden pairs, each elimination propagated as in tier 0,
+##   until no pair makes progress.
+## Tier 2 (search): the depth-first search of sudoku_bits, from the position left by tier 1.
+## A puzzle is resolved by a tier when it is solved or proven without solution there; a puzzle
+## whose search runs out of budget is not resolved.
+## solve_all reports how many puzzles each tier resolved, and the time spent in each tier.
+
+## Usage: python sudoku_pipeline.py [puzzle file ...] [-m search method] [-w workers]
+
+import argparse
+import functools
+import itertools
+import sys
+import time
+
+import sudoku
+import sudoku_bits
+import sudoku_parallel as parallel
+from sudoku_bits import allbits, assign, bitcount, digitbit, eliminate, lowbit, to_values
+from sudoku_stats import Budget, exceeded
+from sudoku_topology import peers, unit_membership, unitlist
+
+tiers = ('propagation', 'pairs', 'search')
+
+
+################ Propagation ################
+
+def propagate_grid(grid):
+    """Convert grid to a list of 81 candidate masks, with naked and hidden singles propagated
+    (same result as sudoku_bits.parse_grid), or return False if a contradiction is detected."""
+    chars = sudoku_bits.grid_chars(grid)
+    used = [0] * 27  # digits of the clues of each unit
+    for i, c in enumerate(chars):
+        if c in digitbit:
+            b = digitbit[c]
+            for k in unit_membership[i]:
+                if used[k] & b:
+                    return False  ## Same digit twice in a unit
+                used[k] |= b
+    cands = [digitbit[c] if c in digitbit else allbits & ~(used[k1] | used[k2] | used[k3])
+             for c, (k1, k2, k3) in zip(chars, unit_membership)]
+    ## Naked singles of the empty squares
+    for i, c in enumerate(chars):
+        m = cands[i]
+        if c not in digitbit and bitcount[m] <= 1:
+            if not m:
+                return False  ## No digit left for square i
+            for p in peers[i]:
+                if cands[p] & m and not eliminate(cands, p, m):
+                    return False
+    ## Hidden singles (after that, eliminate finds the new ones)
+    for u in unitlist:
+        once = twice = 0
+        for i in u:
+            twice |= once & cands[i]
+            once |= cands[i]
+        if once != allbits:
+            return False  ## No place left for a digit
+        single = once & ~twice
+        while single:
+            b = lowbit[single]
+            single ^= b
+            i = next(i for i in u if cands[i] & b)
+            if cands[i] != b and not assign(cands, i, b):
+                return False
+    return cands
+
+
+################ Pairs ################
+
+def remove(cands, i, m):
+    """Eliminate the digits of mask m from cands[i] and propagate.
+    Return cands, except return False if a contradiction is detected."""
+    m &= cands[i]
+    while m:
+        b = lowbit[m]
+        if not eliminate(cands, i, b):
+            return False
+        m ^= b
+    return cands
+
+
+def naked_pairs(cands, u):
+    """Two squares of unit u with the same two digits: remove them from the rest of the unit.
+    Return True if something was removed, None if not, False on a contradiction."""
+    progress = None
+    for a, b in itertools.combinations([i for i in u if bitcount[cands[i]] == 2], 2):
+        m = cands[a]
+        if m != cands[b] or bitcount[m] != 2:
+            continue  ## (cands changed since the list was made)
+        for i in u:
+            if i != a and i != b and cands[i] & m:
+                if not remove(cands, i, m):
+                    return False
+                progress = True
+    return progress
+
+
+def hidden_pairs(cands, u):
+    """Two digits with the same two places in unit u, and no other: remove the other digits from those places.
+    Return True if something was removed, None if not, False on a contradiction."""
+    once = twice = more = 0  # digits with at least 1, 2, 3 places in u
+    for i in u:
+        m = cands[i]
+        more |= twice & m
+        twice |= once & m
+        once |= m
+    two_places = twice & ~more
+    if bitcount[two_places] < 2:
+        return None  ## (the common case: no need to look for the places)
+    progress = None
+    places = {}  # (i, j) -> digit bits with exactly these two places
+    while two_places:
+        b = lowbit[two_places]
+        two_places ^= b
+        where = tuple(i for i in u if cands[i] & b)
+        places[where] = places.get(where, 0) | b
+    for (a, b), m in places.items():
+        if bitcount[m] == 2:
+            for i in a, b:
+                if cands[i] & ~m:
+                    if not remove(cands, i, cands[i] & ~m):
+                        return False
+                    progress = True
+    return progress
+
+
+def pairs(cands):
+    """Apply naked and hidden pairs until none makes progress.
+    Return cands, except return False if a contradiction is detected."""
+    progress = True
+    while progress:
+        progress = False
+        for u in unitlist:
+            for rule in naked_pairs, hidden_pairs:
+                result = rule(cands, u)
+                if result is False:
+                    return False
+                progress = progress or result
+    return cands
+
+
+def filled(cands):
+    return all(bitcount[m] == 1 for m in cands)
+
+
+################ Pipeline ################
+
+def solve(grid, search_method='Norvig Heuristic', budget=None):
+    """Solve grid through the tiers. Return (values dict or False, index of the tier that resolved it,
+    CPU seconds spent in each tier). The search of the last tier stops when budget (a sudoku_stats.Budget)
+    is exhausted, and the values are then exceeded."""
+    times = [0.0] * len(tiers)
+    start = time.process_time()
+    cands = propagate_grid(grid)
+    times[0] = time.process_time() - start
+    if cands is False or filled(cands):
+        return to_values(cands), 0, times
+    start = time.process_time()
+    cands = pairs(cands)
+    times[1] = time.process_time() - start
+    if cands is False or filled(cands):
+        return to_values(cands), 1, times
+    start = time.process_time()
+    cands = sudoku_bits.search(cands, search_method, budget)
+    times[2] = time.process_time() - start
+    return (exceeded if cands is exceeded else to_values(cands)), 2, times
+
+
+def time_solve(grid, search_method='Norvig Heuristic', max_nodes=None, max_seconds=None):
+    """solve() within a Budget, when max_nodes or max_seconds is not None. Module-level for the worker processes."""
+    budget = Budget(max_nodes, max_seconds) if max_nodes is not None or max_seconds is not None else None
+    return solve(grid, search_method, budget)
+
+
+def solve_all(grids, name='', search_method='Norvig Heuristic', workers=1, max_nodes=None, max_seconds=None):
+    """Solve a sequence of grids through the tiers and report how many puzzles each tier resolved.
+    When workers is not 1, the grids are solved in a pool of workers processes (None for one per CPU).
+    Return the list of (values, tier) of the grids."""
+    if search_method not in sudoku_bits.search_methods:
+        raise ValueError(
+            f"Unknown search method {search_method}. Available search methods are {sudoku_bits.search_methods}")
+    grids = list(grids)
+    results, wall = parallel.run(
+        functools.partial(time_solve, search_method=search_method, max_nodes=max_nodes, max_seconds=max_seconds),
+        grids, workers)
+    N = len(grids)
+    if N >= 1:
+        solved = sum(sudoku.solved(values) for values, tier, times in results)
+        cpu = sum(sum(times) for values, tier, times in results)
+        print("Solved %d of %d %s puzzles in %.2f secs (avg %.4f secs (%d Hz)). - tiers, then %s" % (
+            solved, N, name, cpu, cpu / N, N / cpu if cpu else 999, search_method))
+        for k, tier in enumerate(tiers):
+            resolved = [values for values, t, times in results if t == k and values is not exceeded]
+            print("    tier %d %-11s resolved %5d (%5.1f%%) - no solution %d - %.2f secs in the tier" % (
+                k, tier, len(resolved), 100 * len(resolved) / N, sum(values is False for values in resolved),
+                sum(times[k] for values, t, times in results)))
+        over_budget = sum(values is exceeded for values, t, times in results)
+        if over_budget or max_nodes is not None or max_seconds is not None:
+            print("    unresolved: budget exceeded %d (%.1f%%) (budget: %s nodes, %s secs)" % (
+                over_budget, 100 * over_budget / N, max_nodes, max_seconds))
+        parallel.report(N, wall, cpu, workers)
+    return [(values, tier) for values, tier, times in results]
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    assert solve(sudoku.grid1)[1] == 0 and sudoku.solved(solve(sudoku.grid1)[0])
+    for grid in sudoku.from_file('MesSudokus/top95.txt')[:20] + [sudoku.hard1]:
+        assert propagate_grid(grid) == sudoku_bits.parse_grid(grid)
+    assert solve('11' + '.' * 79)[:2] == (False, 0)
+    values, tier, times = solve(sudoku.hard1)
+    assert tier == 2 and sudoku.solved(values)
+    ## Naked pair: A1 and A2 hold only 1 and 2, which go from the rest of row A
+    cands = [allbits] * 81
+    cands[0] = cands[1] = 0b11
+    assert naked_pairs(cands, unitlist[9]) and all(cands[i] == allbits & ~0b11 for i in range(2, 9))
+    ## Hidden pair: 1 and 2 can only go in A1 and A2 of row A, which keep only 1 and 2
+    cands = [allbits] * 81
+    for i in range(2, 9):
+        cands[i] &= ~0b11
+    assert hidden_pairs(cands, unitlist[9]) and cands[0] == cands[1] == 0b11
+    assert not hidden_pairs(cands, unitlist[9])
+    results = solve_all(sudoku.from_file('MesSudokus/top95.txt'), 'top95')
+    assert all(sudoku.solved(values) for values, tier in results) and {tier for values, tier in results} == {1, 2}
+    results = solve_all([sudoku.hard1] * 2, 'hard1', 'Brute Force', workers=2, max_nodes=1)
+    assert all(values is exceeded and tier == 2 for values, tier in results)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(description='Solve puzzles through the tiers: propagation, pairs, search.')
+        parser.add_argument('sources', nargs='+', help='puzzle files, one puzzle per line')
+        parser.add_argument('-m', '--method', default='Norvig Heuristic', help='search method of the last tier')
+        parser.add_argument('-w', '--workers', type=int, default=1, help='worker processes (0 for one per CPU)')
+        args = parser.parse_args()
+        from sudoku_stream import read_puzzles
+        for source in args.sources:
+            solve_all(read_puzzles(source), source, args.method, args.workers or None)
+    else:
+        test()
@@ -0,0 +1,172 @@
+## On-demand profiling of the slow puzzles of a batch
+
+## A Profiler runs each puzzle of solve_all under cProfile, or under a sampling
+## profiler (a thread that records the stack of the solving thread every few
+## milliseconds, much cheaper than cProfile on the eliminate/assign recursion).
+## Only the profiles of the puzzles slower than the threshold, or among the top_k
+## slowest, are kept. write() saves them as pstats files (python -m pstats, snakeviz)
+## and collapsed stack files, one "frame;frame;...;frame count" line per stack,
+## as read by flamegraph.pl or speedscope.
+
+## Usage: sudoku_norvig.solve_all(grids, name, None, 'Norvig Heuristic',
+##                                profiler=Profiler(threshold=0.05, top_k=5, directory='profiles'))
+
+import cProfile
+import collections
+import heapq
+import os
+import pstats
+import sys
+import threading
+import time
+
+modes = ('cprofile', 'sample', 'both')
+
+
+class Sampler:
+    """Count the stacks of the calling thread every interval seconds, in a background thread.
+    With the GIL, the samples are at least sys.getswitchinterval() apart."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()  # 'frame;frame;...' -> number of samples
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.root = sys._getframe(1)  # Frames from the caller of start() up are not recorded
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                stack.append(frame)
+                frame = frame.f_back
+            ## Only the stacks of the profiled call (not of start() or stop(), called from the root too)
+            if stack and frame is self.root and stack[-1].f_code.co_filename != __file__:
+                self.stacks[';'.join(frame_name(f) for f in reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class Profiler:
+    """Profile calls one by one and keep the profiles of the slow ones: the calls over threshold
+    seconds (when not None) and the top_k slowest (when not None).
+    mode is 'cprofile' (pstats files), 'sample' (collapsed stacks only) or 'both'."""
+
+    def __init__(self, threshold=None, top_k=None, directory='profiles', mode='cprofile', interval=0.005):
+        if mode not in modes:
+            raise ValueError(f"Unknown profiling mode {mode}. Available modes are {modes}")
+        self.threshold = threshold
+        self.top_k = top_k
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self.calls = 0
+        self.slow = []  # (seconds, call number, label, profile, stacks) over the threshold
+        self.top = []  # Heap of the top_k slowest, same tuples
+
+    def run(self, label, function, *args, **kwargs):
+        """Call function(*args, **kwargs) under the profiler(s) and return its result."""
+        self.calls += 1
+        profile = cProfile.Profile() if self.mode != 'sample' else None
+        sampler = Sampler(self.interval) if self.mode != 'cprofile' else None
+        if sampler:
+            sampler.start()
+        if profile:
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            t = time.perf_counter() - start
+            if profile:
+                profile.disable()
+            if sampler:
+                sampler.stop()
+            self.keep((t, self.calls, label, profile, sampler.stacks if sampler else None))
+
+    def wrap(self, function):
+        """Return function(item) profiled, with item as label (for parallel.run with one worker)."""
+        return lambda item: self.run(item, function, item)
+
+    def keep(self, record):
+        if self.threshold is not None and record[0] > self.threshold:
+            self.slow.append(record)
+        elif self.top_k:
+            if len(self.top) < self.top_k:
+                heapq.heappush(self.top, record[:2] + (record,))
+            elif record[0] > self.top[0][0]:
+                heapq.heapreplace(self.top, record[:2] + (record,))
+
+    def kept(self):
+        """Return the kept records, slowest first."""
+        return sorted(self.slow + [entry[2] for entry in self.top], key=lambda r: -r[0])
+
+    def write(self):
+        """Write a .pstats and/or .collapsed file per kept call, plus all.pstats / all.collapsed that merge
+        them, in the directory. Return the paths written."""
+        kept = self.kept()
+        if not kept:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        paths, merged, all_stacks = [], None, collections.Counter()
+        for t, k, label, profile, stacks in kept:
+            base = os.path.join(self.directory, 'call%05d-%.3fs' % (k, t))
+            if profile:
+                stats = pstats.Stats(profile)
+                stats.dump_stats(base + '.pstats')
+                paths.append(base + '.pstats')
+                merged = stats if merged is None else merged.add(stats)
+            if stacks is not None:
+                write_collapsed(stacks, base + '.collapsed')
+                paths.append(base + '.collapsed')
+                all_stacks.update(stacks)
+            with open(base + '.txt', 'w') as f:
+                f.write('%s\n%.6f secs\n' % (label, t))
+        if merged is not None:
+            merged.dump_stats(os.path.join(self.directory, 'all.pstats'))
+            paths.append(os.path.join(self.directory, 'all.pstats'))
+        if all_stacks:
+            write_collapsed(all_stacks, os.path.join(self.directory, 'all.collapsed'))
+            paths.append(os.path.join(self.directory, 'all.collapsed'))
+        return paths
+
+
+def write_collapsed(stacks, filename):
+    with open(filename, 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write('%s %d\n' % (stack, count))
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    import tempfile
+    import sudoku_norvig
+    grids = sudoku_norvig.from_file('MesSudokus/top95.txt')[:6]
+    directory = tempfile.mkdtemp()
+    profiler = Profiler(top_k=2, directory=directory, mode='both', interval=0.001)
+    for grid in grids:
+        assert sudoku_norvig.solved(profiler.run(grid, sudoku_norvig.solve, grid, 'Brute Force'))
+    kept = profiler.kept()
+    assert len(kept) == 2 and kept[0][0] >= kept[1][0] and profiler.calls == 6
+    paths = profiler.write()
+    assert os.path.join(directory, 'all.pstats') in paths
+    assert 'eliminate' in str(pstats.Stats(os.path.join(directory, 'all.pstats')).stats)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,202 @@
+## Difficulty rating by the deduction rules a puzzle needs
+
+## The puzzle is solved by deduction only, always with the weakest rule that makes
+## progress (after any progress, the rules are tried again from the weakest):
+##   naked single, hidden single, locked candidates (pointing / claiming),
+##   naked pair, hidden pair, naked triple, hidden triple.
+## The rating is the hardest rule that was needed. When the rules are stuck before the
+## end, the puzzle is rated 'search', with the search nodes that sudoku_norvig needs
+## from the stuck position (Norvig Heuristic: fewest possibilities first).
+## The candidates are the bitmasks of sudoku_bits (bit k set when digit k+1 is possible).
+
+## Usage: python sudoku_rate.py puzzle_file [-w workers]
+## Each output line is "<puzzle><TAB><hardest rule><TAB><search nodes>"; the summary goes to stderr.
+
+import argparse
+import collections
+import itertools
+import sys
+
+import sudoku_bits
+import sudoku_norvig
+import sudoku_parallel as parallel
+from sudoku_bits import allbits, bitcount, digitbit
+from sudoku_stats import SolveStats
+from sudoku_topology import peers, unitlist
+
+## (box, line, their 3 common squares) for every box and line (column or row) that cross
+intersections = [(box, line, set(box) & set(line)) for box in unitlist[18:] for line in unitlist[:18]
+                 if len(set(box) & set(line)) == 3]
+
+
+class Contradiction(Exception):
+    """The puzzle has no solution."""
+
+
+################ Deduction rules ################
+## Each rule takes the list of candidate masks, changes it in place and returns True
+## when it made progress (False otherwise), or raises Contradiction.
+
+def remove(cands, i, m):
+    """Remove the digits of mask m from square i. Return True if something was removed."""
+    if not cands[i] & m:
+        return False
+    cands[i] &= ~m
+    if not cands[i]:
+        raise Contradiction
+    return True
+
+
+def naked_singles(cands):
+    """A square with a single digit: remove that digit from its peers."""
+    progress = False
+    for i in range(81):
+        if bitcount[cands[i]] == 1:
+            for p in peers[i]:
+                progress |= remove(cands, p, cands[i])
+    return progress
+
+
+def hidden_singles(cands):
+    """A digit with a single place in a unit goes there."""
+    for u in unitlist:
+        for k in range(9):
+            b = 1 << k
+            places = [i for i in u if cands[i] & b]
+            if not places:
+                raise Contradiction
+            if len(places) == 1 and cands[places[0]] != b:
+                cands[places[0]] = b
+                return True
+    return False
+
+
+def locked_candidates(cands):
+    """The places of a digit in a box are all on one line (pointing), or its places on a line are
+    all in one box (claiming): remove the digit from the rest of the other unit."""
+    progress = False
+    for box, line, common in intersections:
+        for k in range(9):
+            b = 1 << k
+            in_common = any(cands[i] & b for i in common)
+            if in_common and not any(cands[i] & b for i in box if i not in common):
+                progress |= any([remove(cands, i, b) for i in line if i not in common])
+            if in_common and not any(cands[i] & b for i in line if i not in common):
+                progress |= any([remove(cands, i, b) for i in box if i not in common])
+    return progress
+
+
+def naked_subsets(cands, n):
+    """n squares of a unit with only n digits between them: remove those digits from the rest of the unit."""
+    progress = False
+    for u in unitlist:
+        open_squares = [i for i in u if 1 < bitcount[cands[i]] <= n]
+        for subset in itertools.combinations(open_squares, n):
+            m = 0
+            for i in subset:
+                m |= cands[i]
+            if bitcount[m] == n:
+                progress |= any([remove(cands, i, m) for i in u if i not in subset])
+    return progress
+
+
+def hidden_subsets(cands, n):
+    """n digits of a unit with only n places between them: remove the other digits from those places."""
+    progress = False
+    for u in unitlist:
+        places = dict((k, [i for i in u if cands[i] & 1 << k]) for k in range(9))
+        open_digits = [k for k in range(9) if 1 < len(places[k]) <= n]
+        for subset in itertools.combinations(open_digits, n):
+            squares = set(i for k in subset for i in places[k])
+            if len(squares) == n:
+                m = sum(1 << k for k in subset)
+                progress |= any([remove(cands, i, allbits & ~m) for i in squares])
+    return progress
+
+
+rules = (('naked single', naked_singles),
+         ('hidden single', hidden_singles),
+         ('locked candidates', locked_candidates),
+         ('naked pair', lambda cands: naked_subsets(cands, 2)),
+         ('hidden pair', lambda cands: hidden_subsets(cands, 2)),
+         ('naked triple', lambda cands: naked_subsets(cands, 3)),
+         ('hidden triple', lambda cands: hidden_subsets(cands, 3)))
+levels = ('invalid',) + tuple(name for name, rule in rules) + ('search',)  # from easiest to hardest
+
+
+################ Rating ################
+
+def rate(grid):
+    """Rate grid. Return (hardest rule needed, search nodes, {rule: number of times it made progress}).
+    The hardest rule is one of levels: 'invalid' for a puzzle without solution, 'search' when the rules
+    are not enough (the search nodes are then counted by sudoku_norvig from the stuck position)."""
+    cands = [digitbit.get(c, allbits) for c in sudoku_bits.grid_chars(grid)]
+    used = collections.Counter()
+    try:
+        while any(bitcount[m] > 1 for m in cands):
+            for name, rule in rules:
+                if rule(cands):
+                    used[name] += 1
+                    break
+            else:
+                break  ## Stuck: no rule makes progress
+        naked_singles(cands)  ## Checks the final position (same digit twice in a unit)
+    except Contradiction:
+        return 'invalid', 0, used
+    hardest = max((levels.index(name) for name in used), default=1)
+    if all(bitcount[m] == 1 for m in cands):
+        return levels[hardest], 0, used
+    stats = SolveStats()
+    values = sudoku_norvig.search(sudoku_bits.to_values(cands), 'Norvig Heuristic', stats)
+    return ('search' if values else 'invalid'), stats.nodes, used
+
+
+def rate_all(grids, name='', workers=1, out=None):
+    """Rate a sequence of grids and report how many need each rule. When out is a file, write
+    one line per grid to it. Return the list of ratings. When workers is not 1, the grids are rated
+    in a pool of workers processes (None for one per CPU)."""
+    grids = list(grids)
+    ratings, wall = parallel.run(rate, grids, workers)
+    if out is not None:
+        for grid, (hardest, nodes, used) in zip(grids, ratings):
+            out.write('%s\t%s\t%d\n' % (grid, hardest, nodes))
+    counts = collections.Counter(hardest for hardest, nodes, used in ratings)
+    nodes = [n for hardest, n, used in ratings if hardest == 'search']
+    print("Rated %d %s puzzles in %.2f secs: %s" % (
+        len(grids), name, wall, ', '.join('%s %d' % (level, counts[level]) for level in levels if counts[level])),
+        file=sys.stderr)
+    if nodes:
+        print("    search needed by %d puzzles, avg %.1f nodes, max %d nodes" % (
+            len(nodes), sum(nodes) / len(nodes), max(nodes)), file=sys.stderr)
+    return ratings
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    assert rate(sudoku_norvig.grid1)[0] == 'naked single'
+    assert rate('11' + '.' * 79)[0] == 'invalid'
+    hardest, nodes, used = rate(sudoku_norvig.hard1)
+    assert hardest == 'search' and nodes > 0
+    ## Hidden pair: 1 and 2 can only go in A1 and A2, which keep only 1 and 2
+    cands = [allbits] * 81
+    for i in range(2, 9):
+        remove(cands, i, 0b11)
+    assert hidden_subsets(cands, 2) and cands[0] == cands[1] == 0b11
+    assert not hidden_subsets(cands, 2)
+    ratings = rate_all(sudoku_norvig.from_file('MesSudokus/top95.txt')[:10], 'top95')
+    assert all(hardest in levels[1:] for hardest, nodes, used in ratings)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(description='Rate the difficulty of sudoku puzzles.')
+        parser.add_argument('source', help='puzzle file, one per line')
+        parser.add_argument('-w', '--workers', type=int, default=1, help='worker processes (0 for one per CPU)')
+        args = parser.parse_args()
+        from sudoku_stream import read_puzzles
+        rate_all(read_puzzles(args.source), args.source, args.workers or None, sys.stdout)
+    else:
+        test()
@@ -0,0 +1,334 @@
+## Local solver service: a line protocol over a Unix socket or a localhost TCP port
+
+## Each request line is a puzzle (81 digits or '.', without spaces), optionally followed
+## by a deadline in milliseconds: "<puzzle> [deadline ms]". It gets one response line,
+## in the order of the requests of its connection (clients can pipeline requests):
+##   the 81-char solution, 'unsolved', 'timeout' (the deadline passed) or 'error <reason>'.
+## The line 'STATS' gets the counters of the service, as one line of JSON.
+
+## The puzzles of all the connections go through one bounded queue. A batcher takes them
+## in micro-batches (up to batch_size puzzles, waiting batch_delay seconds for a batch to
+## fill when the queue runs short) and sends each batch to a process pool, with at most
+## 2 batches per worker in flight. When the workers fall behind, the queue fills up and the
+## connections are not read any more until it drains (backpressure: the clients' writes
+## block), and a connection has at most max_pending requests awaiting their response.
+## A request past its deadline is answered 'timeout' at once; if it is still queued, it is
+## dropped before reaching a worker, and a worker stops its search when the deadline passes
+## (a sudoku_stats.Budget with the time left when the batch is sent).
+
+## Usage: python sudoku_server.py [--unix path | --port port] [-w workers] [-e engine] [-m search method]
+##                                [--batch-size 64] [--batch-delay 0.002] [--queue-size 1024] [--deadline ms]
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sudoku_parallel as parallel
+from sudoku_stats import Budget, exceeded
+from sudoku_stream import RunningStats, engines, solution_line
+
+outcomes = ('solved', 'unsolved', 'timeout', 'error')
+
+
+def solve_batch(grids, engine='bits', search_method='Norvig Heuristic', timeouts=None):
+    """Solve grids and return their response lines. timeouts are the seconds left to solve each grid
+    (None for no limit). Module-level for the worker processes."""
+    solve = engines[engine].solve
+    responses = []
+    for grid, timeout in zip(grids, timeouts or [None] * len(grids)):
+        try:
+            values = solve(grid, search_method, budget=None if timeout is None else Budget(max_seconds=timeout))
+            responses.append('timeout' if values is exceeded else solution_line(values))
+        except Exception as e:  # one bad puzzle must not fail its whole batch
+            responses.append('error %s' % type(e).__name__)
+    return responses
+
+
+def parse_request(line, default_deadline=None):
+    """Return (grid, deadline in seconds or None) of a request line, or raise ValueError."""
+    fields = line.split()
+    if not 1 <= len(fields) <= 2:
+        raise ValueError('expected "<puzzle> [deadline ms]"')
+    grid = fields[0]
+    if sum(c in '0123456789.' for c in grid) != 81 or len(grid) != 81:
+        raise ValueError('a puzzle is 81 digits or .')
+    if len(fields) == 2:
+        try:
+            return grid, max(0.0, float(fields[1]) / 1000)
+        except ValueError:
+            raise ValueError('bad deadline %s' % fields[1]) from None
+    return grid, default_deadline
+
+
+class SolverService:
+    """The asyncio service. start() it in a running event loop, then serve_forever() or close() it.
+    default_deadline is in seconds (None for no deadline), for the requests without their own."""
+
+    def __init__(self, engine='bits', search_method='Norvig Heuristic', workers=None, batch_size=64,
+                 batch_delay=0.002, queue_size=1024, max_pending=256, default_deadline=None):
+        if engine not in engines:
+            raise ValueError(f"Unknown engine {engine}. Available engines are {sorted(engines)}")
+        if search_method not in engines[engine].search_methods:
+            raise ValueError(f"Unknown search method {search_method}. "
+                             f"Available search methods are {engines[engine].search_methods}")
+        self.engine = engine
+        self.search_method = search_method
+        self.workers = workers or parallel.default_workers()
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue_size = queue_size
+        self.max_pending = max_pending
+        self.default_deadline = default_deadline
+        self.counts = collections.Counter()  # requests, outcomes, batches, batched (puzzles sent to the pool)
+        self.latency = RunningStats()  # seconds from request to response
+
+    async def start(self, unix=None, host='127.0.0.1', port=0):
+        """Listen on the Unix socket path unix, or else on host:port (port 0 for any free port)."""
+        self.queue = asyncio.Queue(self.queue_size)  # (grid, response future, start time, deadline time)
+        self.slots = asyncio.Semaphore(2 * self.workers)  # batches in flight
+        self.in_flight = set()  # batch tasks
+        self.connections = set()  # connection tasks
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=random.seed)
+        self.batcher = asyncio.create_task(self.batch_loop())
+        if unix is not None:
+            self.server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        self.started = time.perf_counter()
+        return self.server
+
+    def address(self):
+        """The address listened on: a Unix socket path, or (host, port)."""
+        return self.server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        tasks = [self.batcher] + list(self.in_flight) + list(self.connections)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+    ################ Connections ################
+
+    async def handle(self, reader, writer):
+        self.connections.add(asyncio.current_task())
+        pending = asyncio.Queue(self.max_pending)  # response futures, in request order
+        sender = asyncio.create_task(self.send_responses(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):  # reset, or line over the stream limit
+                    break
+                if not line:
+                    break
+                await pending.put(await self.request(line.decode(errors='replace').strip()))
+            await pending.put(None)
+            await sender
+        except asyncio.CancelledError:
+            pass  # close() of the service; not re-raised, the stream server would log it as an error
+        finally:
+            sender.cancel()
+            writer.close()
+            self.connections.discard(asyncio.current_task())
+
+    async def send_responses(self, pending, writer):
+        connected = True
+        while True:
+            future = await pending.get()
+            if future is None:
+                return
+            response = await future
+            if connected:
+                try:
+                    writer.write(response.encode() + b'\n')
+                    await writer.drain()
+                except ConnectionError:
+                    connected = False  # keep consuming the responses, the reader stops soon
+
+    async def request(self, line):
+        """Handle one request line: return the future of its response line."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if line.upper() == 'STATS':
+            future.set_result(json.dumps(self.stats()))
+            return future
+        start = time.perf_counter()
+        self.counts['requests'] += 1
+        try:
+            grid, deadline = parse_request(line, self.default_deadline)
+        except ValueError as e:
+            self.finish(future, 'error %s' % e, start)
+            return future
+        deadline_time = None
+        if deadline is not None:
+            deadline_time = start + deadline
+            loop.call_later(deadline, self.finish, future, 'timeout', start)
+        await self.queue.put((grid, future, start, deadline_time))  # waits while the queue is full
+        return future
+
+    def finish(self, future, response, start):
+        """Set the response of a request, unless it already has one, and count it."""
+        if future.done():
+            return
+        future.set_result(response)
+        if response.startswith('error'):
+            outcome = 'error'
+        else:
+            outcome = response if response in outcomes else 'solved'
+        self.counts[outcome] += 1
+        self.latency.add(time.perf_counter() - start, outcome == 'solved')
+
+    ################ Batching ################
+
+    async def batch_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_delay)  # let the batch fill up
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            now = time.perf_counter()
+            for grid, future, start, deadline_time in batch:
+                if deadline_time is not None and now >= deadline_time:
+                    self.finish(future, 'timeout', start)
+            batch = [request for request in batch if not request[1].done()]
+            if not batch:
+                continue
+            await self.slots.acquire()
+            task = asyncio.create_task(self.run_batch(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        self.counts['batches'] += 1
+        self.counts['batched'] += len(batch)
+        now = time.perf_counter()
+        timeouts = [None if deadline_time is None else deadline_time - now for grid, future, start, deadline_time in batch]
+        try:
+            responses = await loop.run_in_executor(
+                self.pool, solve_batch, [grid for grid, future, start, deadline_time in batch],
+                self.engine, self.search_method, timeouts)
+        except Exception as e:  # e.g. a worker process died
+            responses = ['error %s' % type(e).__name__] * len(batch)
+        finally:
+            self.slots.release()
+        now = time.perf_counter()
+        for (grid, future, start, deadline_time), response in zip(batch, responses):
+            late = deadline_time is not None and now >= deadline_time
+            self.finish(future, 'timeout' if late else response, start)
+
+    ################ Statistics ################
+
+    def stats(self):
+        """Return the counters of the service (a dict, sent as JSON by the STATS request)."""
+        uptime = time.perf_counter() - self.started
+        answered = sum(self.counts[outcome] for outcome in outcomes)
+        return dict({'uptime_secs': uptime, 'engine': self.engine, 'search_method': self.search_method,
+                     'workers': self.workers, 'requests': self.counts['requests'], 'answered': answered,
+                     'queued': self.queue.qsize(), 'batches_in_flight': len(self.in_flight),
+                     'batches': self.counts['batches'],
+                     'mean_batch_size': self.counts['batched'] / self.counts['batches'] if self.counts['batches'] else 0.0,
+                     'throughput_hz': answered / uptime if uptime else 0.0,
+                     'latency_p50': self.latency.percentile(50), 'latency_p90': self.latency.percentile(90),
+                     'latency_p99': self.latency.percentile(99), 'latency_max': self.latency.max},
+                    **dict((outcome, self.counts[outcome]) for outcome in outcomes))
+
+
+################ Client ################
+
+async def send_lines(lines, unix=None, host='127.0.0.1', port=None):
+    """Send the request lines on one connection (pipelined) and return their response lines."""
+    if unix is not None:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        async def write():
+            for line in lines:
+                writer.write(line.encode() + b'\n')
+                await writer.drain()
+
+        sending = asyncio.create_task(write())
+        responses = [(await reader.readline()).decode().rstrip('\n') for _ in lines]
+        await sending
+        return responses
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    import os
+    import tempfile
+    import sudoku_norvig
+
+    async def run():
+        grids = sudoku_norvig.from_file('MesSudokus/top95.txt')[:30]
+        service = SolverService(workers=2, batch_size=8, queue_size=4, max_pending=4)
+        await service.start()
+        host, port = service.address()[:2]
+        responses = await send_lines(grids + ['bad', grids[0] + ' 0'], host=host, port=port)
+        assert all(sudoku_norvig.solved(sudoku_norvig.grid_values(r)) for r in responses[:30])
+        assert responses[30].startswith('error') and responses[31] == 'timeout'
+        stats = json.loads((await send_lines(['stats'], host=host, port=port))[0])
+        assert stats['requests'] == 32 and stats['solved'] == 30 and stats['timeout'] == 1 and stats['error'] == 1
+        assert stats['batches'] >= 30 / 8 and stats['queued'] == 0
+        await service.close()
+        assert solve_batch([sudoku_norvig.hard1] * 2, 'norvig', 'Brute Force', [0.0, None])[0] == 'timeout'
+        path = os.path.join(tempfile.mkdtemp(), 'sudoku.sock')
+        service = SolverService('norvig', 'Norvig Heuristic', workers=1)
+        await service.start(unix=path)
+        clients = [send_lines(grids[k::3], unix=path) for k in range(3)]
+        for k, responses in enumerate(await asyncio.gather(*clients)):
+            assert responses == [solution_line(sudoku_norvig.solve(g, 'DLX')) for g in grids[k::3]]
+        await service.close()
+
+    asyncio.run(run())
+    print('All tests pass.')
+
+
+async def main(args):
+    service = SolverService(args.engine, args.method, args.workers or None, args.batch_size, args.batch_delay,
+                            args.queue_size, default_deadline=args.deadline / 1000 if args.deadline else None)
+    await service.start(args.unix, port=args.port)
+    print('Listening on %s with %d worker(s)' % (service.address(), service.workers), file=sys.stderr)
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve sudoku solving over a line protocol.')
+    parser.add_argument('--unix', help='Unix socket path (default: localhost TCP)')
+    parser.add_argument('--port', type=int, default=8181, help='TCP port on 127.0.0.1')
+    parser.add_argument('-e', '--engine', default='bits', choices=sorted(engines))
+    parser.add_argument('-m', '--method', default='Norvig Heuristic', help='search method of the engine')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='worker processes (0 for one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=64, help='puzzles per batch sent to a worker')
+    parser.add_argument('--batch-delay', type=float, default=0.002, help='seconds to wait for a batch to fill')
+    parser.add_argument('--queue-size', type=int, default=1024, help='puzzles queued before backpressure')
+    parser.add_argument('--deadline', type=float, help='default deadline of a request, in ms')
+    parser.add_argument('--test', action='store_true', help='run the unit tests')
+    args = parser.parse_args()
+    if args.test:
+        test()
+    else:
+        try:
+            asyncio.run(main(args))
+        except KeyboardInterrupt:
+            pass
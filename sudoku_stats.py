@@ -0,0 +1,111 @@
+## Per-solve statistics
+
+## A SolveStats records the work done on one puzzle: the solver fills it in as it
+## goes (instead of module globals), the caller gets it back with the solution, and
+## solve_all aggregates the records of a batch into means and percentiles.
+## Nothing is shared between solves, so concurrent solves each count their own work.
+## A Budget bounds the work of one solve (search nodes and/or wall clock seconds); a
+## search stopped by its budget returns `exceeded` instead of a solution or False.
+
+import math
+import time
+
+counters = ('nodes', 'backtracks', 'max_depth', 'eliminations', 'assignments', 'naked_pairs')
+phases = ('parse', 'search')  # CPU seconds of each phase of the solve
+
+
+class SolveStats:
+    """The work done to solve one puzzle.
+    nodes: search nodes (squares branched on), backtracks: branches abandoned,
+    max_depth: deepest search node, eliminations: digits removed from a square,
+    assignments: calls to assign, naked_pairs: naked pairs that left a single digit,
+    times: CPU seconds per phase."""
+
+    def __init__(self):
+        for name in counters:
+            setattr(self, name, 0)
+        self.times = dict.fromkeys(phases, 0.0)
+        self.exceeded = None  # 'nodes' or 'deadline' when the solve was stopped by its Budget
+
+    def as_dict(self):
+        d = dict((name, getattr(self, name)) for name in counters)
+        d.update(('%s_secs' % phase, t) for phase, t in self.times.items())
+        return d
+
+    def __repr__(self):
+        return 'SolveStats(%s)' % ', '.join('%s=%s' % item for item in self.as_dict().items())
+
+
+class Budget:
+    """A limit on the work of one solve: at most max_nodes search nodes (or iterations of the
+    local searches) and/or max_seconds of wall clock from the creation of the budget.
+    The searches call spend() once per node: it only reads the clock at the first node, then every
+    check_every nodes."""
+
+    check_every = 64  # a power of 2, at least 2
+
+    def __init__(self, max_nodes=None, max_seconds=None):
+        self.max_nodes = max_nodes
+        self.deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+        self.nodes = 0
+        self.reason = None  # 'nodes' or 'deadline' once exhausted
+
+    def spend(self):
+        """Count one node. Return True when the budget is exhausted (and stays so)."""
+        self.nodes += 1
+        if self.reason is None:
+            if self.max_nodes is not None and self.nodes > self.max_nodes:
+                self.reason = 'nodes'
+            elif (self.deadline is not None and self.nodes & (self.check_every - 1) == 1
+                  and time.perf_counter() > self.deadline):
+                self.reason = 'deadline'
+        return self.reason is not None
+
+    def remaining(self):
+        """Seconds left before the deadline (None without one)."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.perf_counter())
+
+
+class Exceeded:
+    """The type of `exceeded`, the result of a search stopped by its budget.
+    It is false, like the False of a failed search, so existing checks of the results still work."""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'exceeded'
+
+    def __reduce__(self):
+        return 'exceeded'  ## Unpickled as the module's singleton, so `is exceeded` holds in the parent process
+
+
+exceeded = Exceeded()
+
+
+def percentile(sorted_values, p):
+    """Returns the p-th percentile (0 <= p <= 100) of a sorted non empty list, by nearest rank."""
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def aggregate(stats):
+    """Aggregate a non empty list of SolveStats: return {field: {total, mean, p50, p90, p99, max}}."""
+    rows = [s.as_dict() for s in stats]
+    summary = {}
+    for field in rows[0]:
+        values = sorted(row[field] for row in rows)
+        summary[field] = {'total': sum(values), 'mean': sum(values) / len(values),
+                          'p50': percentile(values, 50), 'p90': percentile(values, 90),
+                          'p99': percentile(values, 99), 'max': values[-1]}
+    return summary
+
+
+def report(stats):
+    """Print the per-puzzle distribution of each counter and phase time of a list of SolveStats."""
+    if not stats:
+        return
+    for field, a in aggregate(stats).items():
+        fmt = '%.4f' if field.endswith('_secs') else '%.1f'
+        print(("    %-12s mean " + fmt + ", p50 " + fmt + ", p90 " + fmt + ", p99 " + fmt + ", max " + fmt) % (
+            field, a['mean'], a['p50'], a['p90'], a['p99'], a['max']))
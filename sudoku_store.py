@@ -0,0 +1,187 @@
+## Persistent on-disk solution store (sqlite)
+
+## Unlike sudoku_cache.SolutionCache, solved results survive process restarts:
+## re-running the MesSudokus/*.txt suites is served from the store and only new
+## puzzles pay the solver cost. Puzzles are keyed by their canonical form (see
+## sudoku_cache), so a symmetric variant of a stored puzzle is also a hit. The SolveStats
+## of the solve, when known, are kept with the solution (as JSON).
+
+## A store can be passed as the cache of sudoku.solve / sudoku_norvig.solve, and as
+## the store of solve_all, which looks up all its grids in one batch and inserts the
+## new solutions in bulk.
+
+## Usage: python sudoku_store.py stats solutions.db
+##        python sudoku_store.py compact solutions.db
+
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from sudoku_cache import apply, canonical_form, invert
+from sudoku_stats import exceeded
+from sudoku_topology import squares
+
+schema = '''CREATE TABLE IF NOT EXISTS solutions (
+    puzzle   TEXT PRIMARY KEY,  -- canonical form of the puzzle
+    solution TEXT,              -- canonical solution, NULL when the puzzle has no solution
+    method   TEXT,              -- search method that solved it
+    seconds  REAL,              -- CPU seconds of the solve
+    created  REAL,              -- time.time() of the insertion
+    stats    TEXT               -- SolveStats.as_dict() of the solve as JSON, NULL when not known
+)'''
+batch_size = 500  # Puzzles per SELECT ... IN (...) of a batch lookup
+
+
+class SolutionStore:
+    """An sqlite file of puzzle -> solution (plus solve stats)."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute(schema)
+        if 'stats' not in [column[1] for column in self.db.execute('PRAGMA table_info(solutions)')]:
+            self.db.execute('ALTER TABLE solutions ADD COLUMN stats TEXT')  ## (file made before the column)
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    ################ Lookups ################
+
+    def get(self, grid):
+        """Return the values dict of grid, False if stored as unsolvable, or None if unknown."""
+        return self.get_many([grid]).get(grid)
+
+    def get_many(self, grids):
+        """Batch lookup: return a dict {grid: values or False} of the grids found in the store."""
+        keys = {}  # canonical puzzle -> [(grid, transform)]
+        for grid in grids:
+            key, transform = canonical_form(grid)
+            keys.setdefault(key, []).append((grid, transform))
+        found = {}
+        hits = 0
+        key_list = list(keys)
+        for k in range(0, len(key_list), batch_size):
+            chunk = key_list[k:k + batch_size]
+            rows = self.db.execute('SELECT puzzle, solution FROM solutions WHERE puzzle IN (%s)' %
+                                   ','.join('?' * len(chunk)), chunk)
+            for key, solution in rows:
+                hits += len(keys[key])
+                for grid, transform in keys[key]:
+                    found[grid] = False if solution is None else dict(zip(squares, invert(transform, solution)))
+        self.hits += hits
+        self.misses += sum(len(v) for v in keys.values()) - hits
+        return found
+
+    def get_stats(self, grid):
+        """Return the stored SolveStats fields of grid ({field: value}), or None if unknown or not stored."""
+        row = self.db.execute('SELECT stats FROM solutions WHERE puzzle = ?', (canonical_form(grid)[0],)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    ################ Inserts ################
+
+    def put(self, grid, values, method='', seconds=0.0, stats=None):
+        self.put_many([(grid, values, method, seconds, stats)])
+
+    def put_many(self, rows):
+        """Bulk insert of (grid, values or False, method, seconds, SolveStats or None) in a single transaction."""
+        now = time.time()
+        records = []
+        for grid, values, method, seconds, stats in rows:
+            key, transform = canonical_form(grid)
+            solution = apply(transform, ''.join(values[s] for s in squares)) if values else None
+            records.append((key, solution, method, seconds, now, None if stats is None else json.dumps(stats.as_dict())))
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO solutions (puzzle, solution, method, seconds, created, stats) '
+                                'VALUES (?, ?, ?, ?, ?, ?)', records)
+
+    def solve(self, grid, solver, method=''):
+        """Return the values dict solving grid, from the store or computed with solver (and stored).
+        Same interface as sudoku_cache.SolutionCache.solve."""
+        values = self.get(grid)
+        if values is not None:
+            return values
+        start = time.process_time()
+        values = solver(grid)
+        if values is not exceeded:  ## Out of budget: not known to have no solution, not stored
+            self.put(grid, values, method, time.process_time() - start)
+        return values
+
+    ################ Maintenance ################
+
+    def stats(self):
+        """Return a dict with the number of stored puzzles, the hit rate of this session and the file size."""
+        count, unsolved = self.db.execute(
+            'SELECT COUNT(*), COUNT(*) - COUNT(solution) FROM solutions').fetchone()
+        lookups = self.hits + self.misses
+        return {'puzzles': count, 'unsolved': unsolved, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'file_bytes': os.path.getsize(self.filename) if os.path.exists(self.filename) else 0}
+
+    def compact(self, drop_unsolved=False):
+        """Rebuild the file to reclaim the space of replaced rows (and optionally drop the puzzles
+        stored without solution, e.g. after a budget-limited run). Return (bytes before, bytes after)."""
+        before = os.path.getsize(self.filename)
+        if drop_unsolved:
+            with self.db:
+                self.db.execute('DELETE FROM solutions WHERE solution IS NULL')
+        self.db.execute('VACUUM')
+        self.db.execute('ANALYZE')
+        return before, os.path.getsize(self.filename)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    import random
+    import tempfile
+    import sudoku_bits
+    import sudoku_norvig
+    from sudoku import from_file, solved
+    from sudoku_cache import random_symmetry
+    from sudoku_stats import SolveStats
+    filename = os.path.join(tempfile.mkdtemp(), 'solutions.db')
+    grids = from_file('MesSudokus/hardest.txt')
+    with SolutionStore(filename) as store:
+        assert store.get_many(grids) == {}
+        store.put_many((g, sudoku_bits.solve(g), 'Norvig Heuristic', 0.0, None) for g in grids)
+        stats = SolveStats()
+        store.put(sudoku_norvig.grid1, sudoku_norvig.solve(sudoku_norvig.grid1, 'Brute Force', stats=stats),
+                  'Brute Force', 0.0, stats)
+    with SolutionStore(filename) as store:  # warm start
+        rng = random.Random(3335)
+        variants = [random_symmetry(g, rng) for g in grids]
+        found = store.get_many(grids + variants)
+        assert len(found) == 2 * len(grids) and all(solved(v) for v in found.values())
+        assert store.stats()['puzzles'] == len(grids) + 1
+        assert store.get_stats(sudoku_norvig.grid1)['assignments'] > 0 and store.get_stats(grids[0]) is None
+        store.compact()
+        ## A second solve_all over the same grids is all served from the store (0 secs in total)
+        import contextlib, io
+        import sudoku
+        with contextlib.redirect_stdout(io.StringIO()):  # (sudoku.solve_all displays every grid)
+            sudoku.solve_all(grids[:2], 'hardest', None, store=store)
+            sudoku.solve_all(grids[:2], 'hardest', None, store=store)
+    os.remove(filename)
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] in ('stats', 'compact'):
+        with SolutionStore(sys.argv[2]) as store:
+            if sys.argv[1] == 'compact':
+                print("Compacted %s: %d -> %d bytes" % ((sys.argv[2],) + store.compact()))
+            print(store.stats())
+    else:
+        test()
@@ -0,0 +1,196 @@
+## Streaming puzzle reader and solver pipeline
+
+## Unlike from_file / solve_all, nothing here holds the whole input: puzzles are
+## read lazily (from a file or stdin), solved, and written out one by one with
+## their timing, while the statistics are aggregated online. Memory stays
+## constant, even with multi-million-line puzzle dumps.
+
+## Usage: python sudoku_stream.py [file or -] [-e bits|norvig] [-m search method] [-w workers]
+##        python sudoku_stream.py --test
+## Each output line is "<81-char solution or 'unsolved'><TAB><CPU seconds>"; the
+## summary goes to stderr.
+
+import argparse
+import collections
+import functools
+import math
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sudoku_bits
+import sudoku_norvig
+import sudoku_parallel as parallel
+from sudoku_topology import squares
+
+engines = {'bits': sudoku_bits, 'norvig': sudoku_norvig}  # modules with solve(grid, search_method)
+
+
+################ Reading ################
+
+def read_puzzles(source='-'):
+    """Yield the puzzles of source (a file name, '-' for stdin, or an iterable of lines) one at a time.
+    A puzzle is a line with at least 81 digits or '.'; other lines (separators, comments) are skipped."""
+    if source == '-':
+        lines = sys.stdin
+    elif isinstance(source, str):
+        lines = open(source)
+    else:
+        lines = source
+    try:
+        for line in lines:
+            line = line.strip()
+            if sum(c in '0123456789.' for c in line) >= 81:
+                yield line
+    finally:
+        if lines is not sys.stdin and lines is not source:
+            lines.close()
+
+
+################ Solving ################
+
+def time_solve(grid, engine='bits', search_method='Norvig Heuristic'):
+    """Solve grid and return (grid, values, CPU seconds). Module-level for the worker processes."""
+    start = time.process_time()
+    values = engines[engine].solve(grid, search_method)
+    return grid, values, time.process_time() - start
+
+
+def solve_stream(puzzles, engine='bits', search_method='Norvig Heuristic', workers=1):
+    """Yield (grid, values, CPU seconds) for each puzzle, in input order, as soon as it is solved.
+    With workers != 1 (None for one per CPU), at most 4 puzzles per worker are in flight at any time,
+    so the input is still consumed lazily."""
+    solve_one = functools.partial(time_solve, engine=engine, search_method=search_method)
+    if workers is None:
+        workers = parallel.default_workers()
+    if workers == 1:
+        for grid in puzzles:
+            yield solve_one(grid)
+        return
+    in_flight = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=random.seed) as pool:
+        for grid in puzzles:
+            in_flight.append(pool.submit(solve_one, grid))
+            if len(in_flight) >= 4 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def solution_line(values):
+    """Return the 81-char solution of values, or 'unsolved'."""
+    if not sudoku_norvig.solved(values):
+        return 'unsolved'
+    return ''.join(values[s] for s in squares)
+
+
+################ Online statistics ################
+
+class RunningStats:
+    """Aggregate the solve times online, in constant memory.
+    Mean and variance use Welford's method; percentiles are estimated from a histogram
+    with logarithmic buckets (about 5% wide) from 1 microsecond up."""
+
+    buckets_per_decade = 48
+
+    def __init__(self):
+        self.count = 0
+        self.solved = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean (Welford)
+        self.max = 0.0
+        self.histogram = collections.Counter()  # bucket -> count
+
+    def add(self, t, solved=True):
+        self.count += 1
+        self.solved += bool(solved)
+        self.total += t
+        delta = t - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (t - self.mean)
+        self.max = max(self.max, t)
+        self.histogram[self.bucket(t)] += 1
+
+    def bucket(self, t):
+        return max(0, math.floor((math.log10(max(t, 1e-6)) + 6) * self.buckets_per_decade))
+
+    def stdev(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def percentile(self, p):
+        """Estimated p-th percentile (upper bound of the bucket holding it)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for b in sorted(self.histogram):
+            seen += self.histogram[b]
+            if seen >= rank:
+                return min(self.max, 10 ** ((b + 1) / self.buckets_per_decade - 6))
+        return self.max
+
+    def summary(self, name=''):
+        return ("Solved %d of %d %s puzzles in %.2f secs (avg %.4f secs, stdev %.4f, "
+                "p50 %.4f, p90 %.4f, p99 %.4f, max %.4f secs)" % (
+                    self.solved, self.count, name, self.total, self.mean, self.stdev(),
+                    self.percentile(50), self.percentile(90), self.percentile(99), self.max))
+
+
+def stream_all(source='-', out=sys.stdout, engine='bits', search_method='Norvig Heuristic', workers=1):
+    """Solve every puzzle of source, writing one line per puzzle to out, and return the RunningStats."""
+    stats = RunningStats()
+    for grid, values, t in solve_stream(read_puzzles(source), engine, search_method, workers):
+        solved = sudoku_norvig.solved(values)
+        stats.add(t, solved)
+        out.write('%s\t%.6f\n' % (solution_line(values), t))
+    return stats
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    import statistics
+    from sudoku_stats import percentile
+    grids = sudoku_norvig.from_file('MesSudokus/top95.txt')[:20]
+    lines = ['# a comment', '', '========', grids[0], '  ' + grids[1] + '  ', 'Grid 03']
+    assert list(read_puzzles(lines)) == grids[:2]
+    ## Online statistics against the exact ones (the percentiles are bucket upper bounds, about 5% wide)
+    times = [0.001 * k * k for k in range(1, 101)]
+    stats = RunningStats()
+    for t in random.sample(times, len(times)):
+        stats.add(t)
+    assert math.isclose(stats.mean, statistics.mean(times)) and math.isclose(stats.stdev(), statistics.stdev(times))
+    for p in (50, 90, 99, 100):
+        assert percentile(times, p) <= stats.percentile(p) <= percentile(times, p) * 1.05
+    ## Results in input order, with at most 4 puzzles per worker in flight
+    consumed = []
+
+    def puzzles():
+        for grid in grids:
+            consumed.append(grid)
+            yield grid
+
+    for k, (grid, values, t) in enumerate(solve_stream(puzzles(), workers=2)):
+        assert grid == grids[k] and sudoku_norvig.solved(values) and len(consumed) <= k + 1 + 4 * 2
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve a stream of sudoku puzzles, one per line.')
+    parser.add_argument('source', nargs='?', default='-', help="puzzle file, or - for stdin (default)")
+    parser.add_argument('-e', '--engine', default='bits', choices=sorted(engines))
+    parser.add_argument('-m', '--method', default='Norvig Heuristic', help='search method of the engine')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='worker processes (0 for one per CPU)')
+    parser.add_argument('--test', action='store_true', help='run the unit tests')
+    args = parser.parse_args()
+    if args.test:
+        test()
+        sys.exit()
+    start = time.perf_counter()
+    stats = stream_all(args.source, sys.stdout, args.engine, args.method, args.workers or None)
+    wall = time.perf_counter() - start
+    print(stats.summary(args.source), file=sys.stderr)
+    print("wall clock %.2f secs (%d Hz)" % (wall, stats.count / wall if wall else 999), file=sys.stderr)
@@ -0,0 +1,131 @@
+## Precomputed Sudoku topology shared by all the solvers
+
+## The tables are built once, at import, and are immutable (tuples, frozensets and
+## read-only mappings), so every solver and every puzzle can share them instead of
+## rebuilding them from string cross products, and no solver can change them under another. Boards of other sizes (4x4 to 25x25) have their own tables,
+## from topology(box).
+
+## Throughout this module we have:
+##   i is a square index, 0..80 (row-major: i = 9*row + col), e.g. 2 for 'A3'
+##   s is a square name,  e.g. 'A3'
+##   u is a unit,         a tuple of 9 square indexes
+##   k is a unit index,   0..26 (0..8 columns, 9..17 rows, 18..26 3x3 boxes)
+## (on an n x n board: i in 0..n*n-1, k in 0..3n-1)
+
+import functools
+from types import MappingProxyType
+
+symbols = '123456789ABCDEFGHIJKLMNOP'  # digit symbols of the boards up to 25x25 (box size 5)
+row_names = 'ABCDEFGHIJKLMNOPQRSTUVWXY'
+
+
+def cross(A, B):
+    "Cross product of elements in A and elements in B."
+    return [a + b for a in A for b in B]
+
+
+class Topology:
+    """The tables of a board with boxes of box x box squares: n = box*box digits, rows, columns
+    and boxes, n*n squares (row-major). Get them with topology(box), which builds them once."""
+
+    def __init__(self, box):
+        if not 2 <= box <= 5:
+            raise ValueError(f"Box size {box} not supported (2 to 5, i.e. 4x4 to 25x25 boards)")
+        self.box = box
+        self.n = n = box * box
+        self.size = n * n  # number of squares
+        self.digits = symbols[:n]
+        self.rows = row_names[:n]
+        self.cols = tuple(str(c) for c in range(1, n + 1))
+        self.squares = tuple(r + c for r in self.rows for c in self.cols)  # index -> name
+        self.square_index = MappingProxyType(dict((s, i) for i, s in enumerate(self.squares)))  # name -> index
+        self.row_of = tuple(i // n for i in range(self.size))
+        self.col_of = tuple(i % n for i in range(self.size))
+        self.box_of = tuple(box * (i // (n * box)) + (i % n) // box for i in range(self.size))
+        ## Units are in the same order as in sudoku.py: columns, rows, then boxes
+        self.unitlist = (tuple(tuple(i for i in range(self.size) if self.col_of[i] == c) for c in range(n)) +
+                         tuple(tuple(i for i in range(self.size) if self.row_of[i] == r) for r in range(n)) +
+                         tuple(tuple(i for i in range(self.size) if self.box_of[i] == b) for b in range(n)))
+        self.unit_membership = tuple((self.col_of[i], n + self.row_of[i], 2 * n + self.box_of[i])
+                                     for i in range(self.size))
+        self.units = tuple(tuple(self.unitlist[k] for k in self.unit_membership[i]) for i in range(self.size))
+        self.peers = tuple(tuple(sorted(set(sum(self.units[i], ())) - {i})) for i in range(self.size))
+        ## Same tables with square names, for the solvers working on dicts keyed by 'A1'...
+        self.named_unitlist = tuple(tuple(self.squares[i] for i in u) for u in self.unitlist)
+        self.named_units = MappingProxyType(dict(
+            (self.squares[i], tuple(self.named_unitlist[k] for k in self.unit_membership[i])) for i in range(self.size)))
+        self.named_peers = MappingProxyType(dict(
+            (self.squares[i], frozenset(self.squares[p] for p in self.peers[i])) for i in range(self.size)))
+        self.row_col = MappingProxyType(dict(
+            (s, (self.row_of[i], self.col_of[i])) for i, s in enumerate(self.squares)))  # {'A3': (0, 2)...
+        self.first_squares_of_boxes = tuple(u[0] for u in self.named_unitlist[2 * n:])  # ('A1', 'A4', 'A7', 'D1'...
+
+
+@functools.lru_cache(maxsize=None)
+def topology(box=3):
+    """Return the (shared) Topology of the boards with box x box boxes."""
+    return Topology(box)
+
+
+## The standard 9x9 tables, as module constants
+standard = topology(3)
+digits = standard.digits
+rows = standard.rows
+cols = digits
+squares = standard.squares
+square_index = standard.square_index
+row_of, col_of, box_of = standard.row_of, standard.col_of, standard.box_of
+unitlist = standard.unitlist
+unit_membership = standard.unit_membership
+units = standard.units
+peers = standard.peers
+named_unitlist = standard.named_unitlist
+named_units = standard.named_units
+named_peers = standard.named_peers
+
+
+def name(i):
+    """Return the name of square i, e.g. 'A3' for 2."""
+    return squares[i]
+
+
+def index(s):
+    """Return the index of square s, e.g. 2 for 'A3'."""
+    return square_index[s]
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    assert len(squares) == 81
+    assert len(unitlist) == 27
+    assert all(len(units[i]) == 3 for i in range(81))
+    assert all(len(peers[i]) == 20 for i in range(81))
+    c2 = index('C2')
+    assert (row_of[c2], col_of[c2], box_of[c2]) == (2, 1, 0)
+    assert [list(u) for u in named_units['C2']] == [['A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2'],
+                                                    ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'C9'],
+                                                    ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']]
+    assert named_peers['C2'] == {'A2', 'B2', 'D2', 'E2', 'F2', 'G2', 'H2', 'I2', 'C1', 'C3',
+                                 'C4', 'C5', 'C6', 'C7', 'C8', 'C9', 'A1', 'A3', 'B1', 'B3'}
+    assert all(name(index(s)) == s for s in squares)
+    for table in named_units, named_peers, square_index:  ## Shared by every solver: read-only
+        try:
+            table['A1'] = None
+        except TypeError:
+            pass
+        else:
+            raise AssertionError('%r is writable' % table)
+    assert isinstance(named_peers['C2'], frozenset) and isinstance(named_unitlist[0], tuple)
+    for box in (2, 4, 5):
+        t = topology(box)
+        assert len(t.unitlist) == 3 * t.n and all(len(p) == 3 * t.n - 2 * box - 1 for p in t.peers)
+        assert all(sorted(sum((t.unitlist[k] for k in range(g * t.n, (g + 1) * t.n)), ())) == list(range(t.size))
+                   for g in range(3))
+    assert topology(4).squares[17] == 'B2' and topology(5).digits[-1] == 'P' and topology(3) is standard
+    print('All tests pass.')
+
+
+if __name__ == '__main__':
+    test()
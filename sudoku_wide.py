@@ -0,0 +1,271 @@
+## Solve N x N Sudoku Puzzles (4x4 to 25x25) with wide candidate bitmasks
+
+## Same algorithm as sudoku_bits.py, for any box size: boxes of box x box squares,
+## n = box*box digits, n*n squares. The tables come from sudoku_topology.topology(box).
+## The possible values of a square are an n-bit integer (25 bits on a 25x25 board), too
+## wide for the lookup tables of sudoku_bits, so the masks are handled with int.bit_count()
+## and m & -m (lowest bit). The propagation uses a worklist instead of recursion (the
+## chains of eliminations get long on big boards) and the search works in place, with an
+## undo trail and an explicit stack, as in sudoku_norvig.
+
+## Throughout this program we have:
+##   t is a Topology,     e.g. topology(4) for 16x16 boards
+##   i is a square index, 0..n*n-1 (row-major: i = n*row + col)
+##   b is a digit bit,    e.g. 1 << 9 for 'A' (the 10th digit)
+##   m is a mask of possible digits (bit k set when digit t.digits[k] is possible)
+##   grid is a grid,      e.g. n*n non-blank chars, with '0' or '.' for empties
+##   cands is a list of n*n masks
+
+import functools
+import random
+import time
+
+import sudoku_parallel as parallel
+from sudoku_stats import Budget, SolveStats, exceeded
+from sudoku_topology import topology
+
+search_methods = {'Brute Force', 'Norvig Heuristic'}
+
+
+################ Unit Tests ################
+
+def test():
+    """A set of tests that must pass."""
+    import sudoku
+    values = sudoku.solve(sudoku.grid1)
+    assert to_grid(solve(sudoku.grid1)) == ''.join(values[s] for s in sudoku.squares)
+    for method in search_methods:
+        assert sudoku.solved(to_values(solve(sudoku.grid1, 3, method), 3))
+        assert sudoku.solved(to_values(solve(sudoku.hard1, 3, method), 3))
+    assert parse_grid('11' + '.' * 14, 2) is False
+    rng = random.Random(21)
+    for box in (2, 3, 4, 5):
+        puzzle = random_puzzle(box, 0.6, rng)
+        cands = solve(puzzle, box)
+        assert solved(cands, box) and all(c in '.' + d for c, d in zip(puzzle, to_grid(cands, box)))
+    stats = SolveStats()
+    assert solved(solve(random_puzzle(4, 0.4, rng), 4, 'Norvig Heuristic', stats), 4) and stats.assignments > 0
+    stats = SolveStats()
+    assert solve(random_puzzle(5, 0.3, rng), 5, 'Brute Force', stats, Budget(max_nodes=2)) is exceeded
+    assert stats.exceeded == 'nodes' and stats.nodes == 2
+    print('All tests pass.')
+
+
+################ Parse a Grid ################
+
+def parse_grid(grid, box=3):
+    """Convert grid to a list of n*n candidate masks, or
+    return False if a contradiction is detected."""
+    t = topology(box)
+    digitbit = dict((d, 1 << k) for k, d in enumerate(t.digits))
+    cands = [(1 << t.n) - 1] * t.size
+    for i, c in enumerate(grid_chars(grid, box)):
+        if c in digitbit and not assign(cands, i, digitbit[c], t):
+            return False  ## (Fail if we can't assign d to square i.)
+    return cands
+
+
+def grid_chars(grid, box=3):
+    """Return the n*n meaningful chars of grid, with '0' or '.' for empties."""
+    t = topology(box)
+    chars = [c for c in grid.upper() if c in t.digits or c in '0.']
+    assert len(chars) == t.size, f"A {t.n}x{t.n} grid needs {t.size} squares, got {len(chars)}"
+    return chars
+
+
+def to_grid(cands, box=3):
+    """Convert a list of candidate masks to a grid string, with '.' for the squares not filled."""
+    digits = topology(box).digits
+    return ''.join(digits[m.bit_length() - 1] if m and not m & (m - 1) else '.' for m in cands)
+
+
+def to_values(cands, box=3):
+    """Convert a list of candidate masks to a values dict {'A1': '12349', ...}, as used by sudoku.py."""
+    if cands is False:
+        return False
+    t = topology(box)
+    return dict((s, ''.join(d for k, d in enumerate(t.digits) if m >> k & 1)) for s, m in zip(t.squares, cands))
+
+
+################ Constraint Propagation ################
+
+def assign(cands, i, b, t, trail=None, stats=None):
+    """Eliminate all the other digits (except b) from cands[i] and propagate.
+    Return cands, except return False if a contradiction is detected."""
+    if stats is not None:
+        stats.assignments += 1
+    if not cands[i] & b:
+        return False
+    return eliminate(cands, i, cands[i] & ~b, t, trail, stats)
+
+
+def eliminate(cands, i, m, t, trail=None, stats=None):
+    """Eliminate the digits of mask m from cands[i], and the ones it implies, until fixpoint:
+    (1) a square reduced to one digit removes it from its peers, (2) a digit with one place left
+    in a unit goes there. Every change is recorded on trail (square, previous mask, ...), if any.
+    Return cands, except return False if a contradiction is detected."""
+    peers, units = t.peers, t.units
+    worklist = [(i, m)]  # (square, digits to remove)
+    while worklist:
+        i, m = worklist.pop()
+        m &= cands[i]
+        if not m:
+            continue  ## Already eliminated
+        if trail is not None:
+            trail += i, cands[i]
+        if stats is not None:
+            stats.eliminations += m.bit_count()
+        left = cands[i] = cands[i] & ~m
+        ## (1) If a square i is reduced to one value, then eliminate it from the peers.
+        if not left:
+            return False  ## Contradiction: removed last value
+        elif not left & (left - 1):
+            worklist.extend((p, left) for p in peers[i] if cands[p] & left)
+        ## (2) If a unit u is reduced to only one place for a removed digit b, then put it there.
+        while m:
+            b = m & -m
+            m ^= b
+            for u in units[i]:
+                place, n = -1, 0
+                for s in u:
+                    if cands[s] & b:
+                        place = s
+                        n += 1
+                        if n > 1:
+                            break
+                if n == 0:
+                    return False  ## Contradiction: no place for this value
+                elif n == 1 and cands[place] != b:
+                    worklist.append((place, cands[place] & ~b))
+    return cands
+
+
+################ Search ################
+
+def solve(grid, box=3, search_method='Norvig Heuristic', stats=None, budget=None):
+    """Solve grid (a box*box x box*box board) and return its candidate masks (one bit each), or False."""
+    return search(parse_grid(grid, box), box, search_method, stats, budget)
+
+
+def search(cands, box=3, search_method='Norvig Heuristic', stats=None, budget=None):
+    """Using depth-first search and propagation, try all possible values.
+    The search works on cands in place (returned when solved): each node records its changes on
+    an undo trail, popped on backtrack, and the nodes are kept on an explicit stack.
+    When budget (a sudoku_stats.Budget) is exhausted, the search stops and returns exceeded."""
+    if cands is False:
+        return False  ## Failed earlier
+    if search_method not in search_methods:
+        raise ValueError(f"Unknown search method {search_method}. Available search methods are {search_methods}")
+    t = topology(box)
+    if stats is None:
+        stats = SolveStats()
+    trail = []  # square, previous mask, ... of every change since the root
+    stack = []  # (trail length at the node, square, iterator over the digit bits left to try) of each node
+    while True:
+        unfilled = [i for i, m in enumerate(cands) if m & (m - 1)]
+        if not unfilled:
+            return cands  ## Solved!
+        if budget is not None and budget.spend():
+            stats.exceeded = budget.reason
+            return exceeded  ## Out of budget
+        if search_method == 'Brute Force':
+            # choose a random unfilled square
+            i = random.choice(unfilled)
+        else:
+            # Chose the unfilled square i with the fewest possibilities
+            i = min(unfilled, key=lambda i: cands[i].bit_count())
+        m = cands[i]
+        # try possible digits for i in random order
+        bits = [1 << k for k in range(t.n) if m >> k & 1]
+        random.shuffle(bits)
+        stats.nodes += 1
+        stack.append((len(trail), i, iter(bits)))
+        stats.max_depth = max(stats.max_depth, len(stack))
+        while stack:
+            mark, i, choices = stack[-1]
+            while len(trail) > mark:  # undo the previous branch of this node
+                previous = trail.pop()
+                cands[trail.pop()] = previous
+            b = next(choices, None)
+            if b is None:
+                stack.pop()  ## No branch left: backtrack
+                stats.backtracks += 1
+            elif assign(cands, i, b, t, trail, stats):
+                break  ## Go down this branch
+            else:
+                stats.backtracks += 1
+        else:
+            return False  ## Every branch failed
+
+
+def solved(cands, box=3):
+    """A puzzle is solved if each unit is a permutation of the n digits."""
+    if cands is False:
+        return False
+    t = topology(box)
+    full = (1 << t.n) - 1
+    if any(m & (m - 1) or not m for m in cands):
+        return False
+    for u in t.unitlist:
+        seen = 0
+        for i in u:
+            seen |= cands[i]
+        if seen != full:
+            return False
+    return True
+
+
+################ Random puzzles ################
+
+def random_puzzle(box=3, clues=0.5, rng=random):
+    """Make a random puzzle of a box*box x box*box board, keeping about a fraction clues of the squares.
+    The solution is the standard pattern, with its digits, bands, stacks, rows within a band and columns
+    within a stack shuffled; the puzzle is solvable but may have several solutions."""
+    t = topology(box)
+    n = t.n
+
+    def shuffled_lines():
+        return [g * box + k for g in rng.sample(range(box), box) for k in rng.sample(range(box), box)]
+
+    rows, cols, digits = shuffled_lines(), shuffled_lines(), rng.sample(t.digits, n)
+    pattern = lambda r, c: (box * (r % box) + r // box + c) % n
+    solution = [digits[pattern(rows[i // n], cols[i % n])] for i in range(t.size)]
+    return ''.join(d if rng.random() < clues else '.' for d in solution)
+
+
+################ System test ################
+
+def time_solve(grid, box, search_method):
+    """Solve grid and return (CPU seconds, cands, SolveStats). Module-level so that
+    solve_all can run it in worker processes."""
+    stats = SolveStats()
+    start = time.process_time()
+    cands = solve(grid, box, search_method, stats)
+    return time.process_time() - start, cands, stats
+
+
+def solve_all(grids, name='', box=3, search_method='Norvig Heuristic', workers=1):
+    """Attempt to solve a sequence of grids of one board size. Report results.
+    When workers is not 1, the grids are solved in a pool of workers processes
+    (None for one per CPU)."""
+    if search_method not in search_methods:
+        raise ValueError(f"Unknown search method {search_method}. Available search methods are {search_methods}")
+    grids = list(grids)
+    timed, wall = parallel.run(functools.partial(time_solve, box=box, search_method=search_method), grids, workers)
+    times = [t for t, cands, stats in timed]
+    results = [solved(cands, box) for t, cands, stats in timed]
+    N = len(grids)
+    hz = N / sum(times) if sum(times) != 0.0 else 999
+    if N >= 1:
+        n = box * box
+        print("Solved %d of %d %s %dx%d puzzles in %.2f secs (avg %.4f secs (%d Hz), max %.2f secs). "
+              "Search nodes %d - %s" % (sum(results), N, name, n, n, sum(times), sum(times) / N, hz, max(times),
+                                       sum(stats.nodes for t, cands, stats in timed), search_method))
+        parallel.report(N, wall, sum(times), workers)
+
+
+if __name__ == '__main__':
+    test()
+    # rng = random.Random(0)
+    # for box in (2, 3, 4, 5):
+    #     solve_all([random_puzzle(box, 0.55, rng) for _ in range(20)], 'random', box)